@@ -22,11 +22,11 @@ SOFTWARE.
 """
 import os
 import re
+import time
 import asyncio
 import datetime
 from contextlib import suppress
 
-import asyncpg
 import discord
 import pygicord
 from aiohttp import ClientSession
@@ -34,10 +34,18 @@ from termcolor import colored
 from discord.ext import commands
 
 import config
-from utils import i18n
+from utils import i18n, queries
+from utils.bus import Bus
 from utils.i18n import _
+from utils.pool import Pool
 from utils.time import human_timedelta
+from utils.cache import LRUCache
+from utils.games import TriviaGames
+from utils.usage import UsageAggregator
+from utils.catalog import Catalog
 from classes.context import Context
+from utils.migrations import apply_migrations
+from utils.leaderboard import Leaderboard
 
 try:
     import uvloop
@@ -54,6 +62,16 @@ class Bot(commands.AutoShardedBot):
         super().__init__(command_prefix=config.default_prefix, **kwargs)
         self.config = config
         self.prefixes = {}
+        self.profiles = LRUCache(maxsize=10_000, ttl=600.0)
+        # users fetched through the API, since they aren't in the client cache
+        self.fetched_users = LRUCache(maxsize=1000, ttl=3600.0)
+        self.usage = UsageAggregator()
+        self.trivia_games = TriviaGames()
+        self.catalog = Catalog(config.random)
+        self.server_board = Leaderboard(
+            10, key="commands_run", exclude=config.ignored_guilds
+        )
+        self.trivia_board = Leaderboard(20, key="won", exclude=(config.owner_id,))
 
         self.paginator = pygicord
 
@@ -73,6 +91,11 @@ class Bot(commands.AutoShardedBot):
     def color(self):
         return config.main_color
 
+    @property
+    def heroes(self):
+        """The keys of the heroes, used to check that an entered hero exists."""
+        return self.catalog.hero_keys
+
     @property
     def debug(self):
         return config.DEBUG
@@ -80,23 +103,87 @@ class Bot(commands.AutoShardedBot):
     def get_uptime(self, *, brief=False):
         return human_timedelta(self.uptime, accuracy=None, brief=brief, suffix=False)
 
-    async def total_commands(self):
-        return await self.pool.fetchval("SELECT total FROM command;")
+    async def total_commands(self, *, background=False):
+        return await self.pool.fetchval(
+            queries.GET_TOTAL_COMMANDS, background=background
+        )
 
     async def on_command(self, ctx):
-        await self.pool.execute("UPDATE command SET total = total + 1 WHERE id = 1;")
+        await self.pool.execute(queries.INCREMENT_TOTAL_COMMANDS)
         if ctx.guild:
-            await self.pool.execute(
-                "INSERT INTO server(id, prefix) VALUES($1, $2) ON CONFLICT (id) DO "
-                "UPDATE SET commands_run = server.commands_run + 1;",
-                ctx.guild.id,
-                self.prefix,
+            server = await self.pool.fetchrow(
+                queries.INCREMENT_SERVER_COMMANDS, ctx.guild.id, self.prefix
             )
-        await self.pool.execute(
-            "INSERT INTO member(id) VALUES($1) ON CONFLICT (id) DO "
-            "UPDATE SET commands_run = member.commands_run + 1;",
-            ctx.author.id,
+            self.server_board.update(server)
+        await self.pool.execute(queries.INCREMENT_MEMBER_COMMANDS, ctx.author.id)
+
+    async def refresh_leaderboards(self, *, background=False):
+        """Reload the leaderboards from the database."""
+        rows = await self.pool.fetch(
+            queries.GET_TOP_SERVERS,
+            self.config.ignored_guilds,
+            self.server_board.size,
+            background=background,
+        )
+        self.server_board.load(rows)
+        rows = await self.pool.fetch(
+            queries.GET_BEST_TRIVIA_PLAYERS,
+            [self.config.owner_id],
+            self.trivia_board.size,
+            background=background,
         )
+        self.trivia_board.load(rows)
+
+    async def get_leaderboard(self, board, amount):
+        if board.stale:
+            await self.refresh_leaderboards()
+        return board.top(amount)
+
+    async def resolve_user(self, user_id):
+        try:
+            user = await self.fetch_user(user_id)
+        except discord.NotFound:
+            user = None
+        self.fetched_users[user_id] = user
+        return user
+
+    async def resolve_users(self, user_ids):
+        """Returns the users with the given ids, None for the unknown ones.
+
+        Users are looked up in the client cache first, then in the users
+        fetched before, and the remaining ones are fetched concurrently.
+        """
+        users = {}
+        missing = []
+        for user_id in user_ids:
+            user = self.get_user(user_id) or self.fetched_users.get(user_id)
+            if user is None and user_id not in self.fetched_users:
+                missing.append(user_id)
+            users[user_id] = user
+
+        fetched = await asyncio.gather(*(self.resolve_user(i) for i in missing))
+        users.update(zip(missing, fetched))
+        return users
+
+    async def load_prefixes(self):
+        rows = await self.pool.fetch(queries.GET_PREFIXES)
+        self.prefixes = {
+            row["id"]: row["prefix"] for row in rows if row["prefix"] != self.prefix
+        }
+
+    def on_prefix_change(self, guild_id, prefix):
+        if guild_id is None:
+            self.loop.create_task(self.load_prefixes())
+        elif prefix is None or prefix == self.prefix:
+            self.prefixes.pop(guild_id, None)
+        else:
+            self.prefixes[guild_id] = prefix
+
+    def on_profile_change(self, member_id, value):
+        if member_id is None:
+            self.profiles.clear()
+        else:
+            self.profiles.pop(member_id)
 
     async def on_message(self, message):
         if not self.is_ready():
@@ -105,9 +192,18 @@ class Bot(commands.AutoShardedBot):
 
     async def invoke(self, ctx):
         member_id = ctx.message.author.id
-        locale = await self.get_cog("Locale").update_locale(member_id)
+        locale = await self.get_cog("Locale").update_locale(member_id, ctx.guild)
         i18n.current_locale.set(locale)
+        start = time.perf_counter()
         await super().invoke(ctx)
+        if ctx.command is not None:
+            self.usage.record(
+                ctx.command.qualified_name,
+                guild_id=ctx.guild and ctx.guild.id,
+                locale=locale,
+                outcome="failed" if ctx.command_failed else "ok",
+                latency=time.perf_counter() - start,
+            )
 
     async def _get_prefix(self, bot, message):
         if not message.guild:
@@ -176,14 +272,24 @@ class Bot(commands.AutoShardedBot):
 
     async def start(self, *args, **kwargs):
         self.session = ClientSession(loop=self.loop)
-        self.pool = await asyncpg.create_pool(
-            **self.config.database, max_size=20, command_timeout=60.0
+        self.pool = await Pool.create(
+            **self.config.database,
+            **self.config.pool,
+            slow_query_threshold=self.config.slow_query_threshold,
+            max_replica_lag=self.config.max_replica_lag,
         )
+        await apply_migrations(self.pool)
+        options = dict(self.config.database)
+        options.pop("replica", None)
+        self.bus = Bus(self.pool, **options)
+        self.bus.subscribe("prefix", self.on_prefix_change)
+        self.bus.subscribe("profile", self.on_profile_change)
+        # listen before caching, so that no change is missed
+        await self.bus.connect()
         # Caching prefixes at startup
-        rows = await self.pool.fetch("SELECT id, prefix FROM server;")
-        for row in rows:
-            if row["prefix"] != self.prefix:
-                self.prefixes[row["id"]] = row["prefix"]
+        await self.load_prefixes()
+        # the heroes are needed to convert the heroes given to the commands
+        await self.catalog.refresh(self.session)
         self.command_prefix = self._get_prefix
         for extension in os.listdir("cogs"):
             if extension.endswith(".py"):
@@ -201,6 +307,11 @@ class Bot(commands.AutoShardedBot):
 
     async def logout(self):
         await self.session.close()
+        with suppress(Exception):
+            await self.usage.flush(self.pool)
+        with suppress(Exception):
+            await self.trivia_games.flush(self.pool)
+        await self.bus.close()
         await self.pool.close()
         await super().logout()
 
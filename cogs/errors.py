@@ -22,6 +22,12 @@ class ErrorHandler(commands.Cog):
             # return if a command has its own error handler
             return
 
+        if isinstance(error, commands.CommandInvokeError) and isinstance(
+            error.original, commands.CheckFailure
+        ):
+            # checks can also be enforced by the command itself
+            error = error.original
+
         if isinstance(error, commands.CommandNotFound):
             return
 
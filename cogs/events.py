@@ -3,8 +3,14 @@ from datetime import datetime
 from contextlib import suppress
 
 import discord
+from termcolor import colored
 from discord.ext import commands
 
+from utils import queries
+
+# Maximum number of servers inserted or deleted by a single statement.
+RECONCILE_BATCH_SIZE = 1000
+
 
 class Events(commands.Cog):
     def __init__(self, bot):
@@ -25,6 +31,41 @@ class Events(commands.Cog):
 
         await channel.send(embed=embed)
 
+    async def reconcile_servers(self):
+        """Sync the server table with the guilds joined or left while offline.
+
+        Only the servers of the shards run by this process are compared.
+        Returns the number of servers inserted and deleted.
+        """
+        guild_ids = [guild.id for guild in self.bot.guilds]
+        shard_ids = list(self.bot.shard_ids or range(self.bot.shard_count or 1))
+        missing, stale = await self.bot.pool.fetchrow(
+            queries.DIFF_SERVERS, guild_ids, self.bot.shard_count or 1, shard_ids
+        )
+        # an empty guild list means that the cache isn't ready, not that every
+        # guild has been left
+        if not guild_ids:
+            stale = []
+
+        async with self.bot.pool.acquire() as conn:
+            for i in range(0, len(missing), RECONCILE_BATCH_SIZE):
+                batch = missing[i : i + RECONCILE_BATCH_SIZE]
+                await conn.execute(queries.INSERT_SERVERS, batch, self.bot.prefix)
+            for i in range(0, len(stale), RECONCILE_BATCH_SIZE):
+                batch = stale[i : i + RECONCILE_BATCH_SIZE]
+                await conn.execute(queries.DELETE_SERVERS, batch)
+
+        for guild_id in stale:
+            self.bot.prefixes.pop(guild_id, None)
+            self.bot.server_board.remove(guild_id)
+        if stale:
+            # the nicknames set in the servers are deleted along with them
+            self.bot.bus.dispatch("nickname", None, None)
+            # the other processes cache the prefixes and nicknames as well
+            await self.bot.bus.publish("prefix", None)
+            await self.bot.bus.publish("nickname", None)
+        return len(missing), len(stale)
+
     @commands.Cog.listener()
     async def on_ready(self):
         print(
@@ -47,10 +88,8 @@ class Events(commands.Cog):
             self.bot.total_lines = 0
             self.bot.get_line_count()
 
-        # caching all Overwatch heroes at startup. Used in
-        # classes/converters.py to check if the entered hero exists.
-        if not hasattr(self.bot, "heroes"):
-            self.bot.heroes = await self.cache_heroes()
+        inserted, deleted = await self.reconcile_servers()
+        print(f"[{colored('SERVERS', 'blue')}] {inserted} inserted, {deleted} deleted")
 
         await self.change_presence()
         await self.send_log(discord.Color.blue(), "Bot is online.")
@@ -77,17 +116,18 @@ class Events(commands.Cog):
 
     @commands.Cog.listener()
     async def on_guild_join(self, guild):
-        await self.bot.pool.execute(
-            "INSERT INTO server(id, prefix) VALUES($1, $2);",
-            guild.id,
-            self.bot.prefix,
-        )
+        await self.bot.pool.execute(queries.INSERT_SERVER, guild.id, self.bot.prefix)
 
     @commands.Cog.listener()
     async def on_guild_remove(self, guild):
         with suppress(KeyError):
             del self.bot.prefixes[guild.id]
-        await self.bot.pool.execute("DELETE FROM server WHERE id = $1;", guild.id)
+        await self.bot.pool.execute(queries.DELETE_SERVER, guild.id)
+        await self.bot.bus.publish("prefix", guild.id)
+        # the nicknames set in the server are deleted along with it
+        self.bot.bus.dispatch("nickname", None, None)
+        await self.bot.bus.publish("nickname", None)
+        self.bot.server_board.remove(guild.id)
 
     async def change_presence(self):
         await self.bot.wait_until_ready()
@@ -99,12 +139,6 @@ class Events(commands.Cog):
             status=discord.Status.idle,
         )
 
-    async def cache_heroes(self):
-        url = self.bot.config.random["hero"]
-        async with self.bot.session.get(url) as r:
-            heroes = await r.json()
-        return [str(h["key"]).lower() for h in heroes]
-
 
 def setup(bot):
     bot.add_cog(Events(bot))
@@ -1,35 +1,72 @@
+import itertools
+
 import discord
 from discord.ext import commands
 
-from utils import i18n
+from utils import i18n, queries
 from utils.i18n import _, locale
+from utils.cache import LRUCache
 from utils.paginator import ChooseLocale
 
+# Maximum number of members whose locale is kept in memory.
+MAX_CACHED_LOCALES = 50_000
+
+# Maximum number of members fetched at once when warming a guild.
+MAX_WARM_MEMBERS = 1000
+
 
 class Locale(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
-        self.bot.locales = {}
+        self.bot.locales = LRUCache(maxsize=MAX_CACHED_LOCALES)
+        # guilds whose members' locales have recently been loaded
+        self.warmed_guilds = LRUCache(maxsize=1000, ttl=3600.0)
+        self.bot.bus.subscribe("locale", self.on_locale_change)
+
+    def cog_unload(self):
+        self.bot.bus.unsubscribe("locale", self.on_locale_change)
+
+    def on_locale_change(self, member_id, locale):
+        if member_id is None:
+            self.bot.locales.clear()
+            self.warmed_guilds.clear()
+        elif locale is None:
+            self.bot.locales.pop(member_id)
+        else:
+            self.bot.locales[member_id] = locale
 
     async def set_locale(self, member_id, locale):
-        query = """INSERT INTO member(id, locale)
-                VALUES($1, $2)
-                ON CONFLICT (id) DO
-                UPDATE SET locale = $2;
-                """
-        await self.bot.pool.execute(query, member_id, locale)
+        await self.bot.pool.execute(queries.SET_LOCALE, member_id, locale)
         self.bot.locales[member_id] = locale
+        await self.bot.bus.publish("locale", member_id, locale)
 
     async def get_locale(self, member_id):
-        return await self.bot.pool.fetchval(
-            "SELECT locale FROM member WHERE id = $1;", member_id
-        )
+        return await self.bot.pool.fetchval(queries.GET_LOCALE, member_id)
 
-    async def update_locale(self, member_id):
+    async def warm_locales(self, guild, member_id):
+        """Load the locales of a guild's cached members with a single query."""
+        self.warmed_guilds[guild.id] = True
+        members = (m.id for m in guild.members if m.id not in self.bot.locales)
+        member_ids = [member_id, *itertools.islice(members, MAX_WARM_MEMBERS)]
+
+        rows = await self.bot.pool.fetch(queries.GET_LOCALES, member_ids)
+        locales = {row["id"]: row["locale"] for row in rows}
+        for member_id in member_ids:
+            # members without a row get the default locale, so that they
+            # don't hit the database on every command they run.
+            self.bot.locales[member_id] = locales.get(member_id, i18n.default_locale)
+
+    async def update_locale(self, member_id, guild=None):
         locale = self.bot.locales.get(member_id)
-        if not locale:
-            locale = await self.get_locale(member_id)
-            self.bot.locales[member_id] = locale
+        if locale is not None:
+            return locale
+
+        if guild is not None and guild.id not in self.warmed_guilds:
+            await self.warm_locales(guild, member_id)
+            return self.bot.locales[member_id]
+
+        locale = await self.get_locale(member_id) or i18n.default_locale
+        self.bot.locales[member_id] = locale
         return locale
 
     @commands.group(invoke_without_command=True, aliases=["locale", "lang"])
@@ -39,7 +76,7 @@ class Locale(commands.Cog):
         _("""Displays your current language set and all the available languages.""")
         embed = discord.Embed(color=self.bot.color)
         embed.title = _("Available Languages")
-        current_locale = self.bot.locales[ctx.author.id] or i18n.current_locale
+        current_locale = i18n.current_locale.get()
         embed.set_footer(
             text=_("Current language set: {locale}").format(locale=current_locale)
         )
@@ -64,7 +101,6 @@ class Locale(commands.Cog):
         try:
             await self.set_locale(ctx.author.id, locale)
             i18n.current_locale.set(locale)
-            self.bot.locales[ctx.author.id] = locale
         except Exception as e:
             await ctx.send(embed=self.bot.embed_exception(e))
         else:
@@ -4,6 +4,7 @@ import re
 import sys
 import copy
 import asyncio
+import datetime
 import textwrap
 import importlib
 import traceback
@@ -14,6 +15,25 @@ from contextlib import suppress, redirect_stdout
 import discord
 from discord.ext import commands
 
+from utils import queries
+from utils.backup import create_backup
+from utils.explain import summarize_plan
+
+# Tables whose rows are counted by the counter table.
+COUNTED_TABLES = ("profile", "server", "rating", "nickname")
+
+TRIVIA_COUNTERS = ("trivia_started", "trivia_won", "trivia_lost", "trivia_contribs")
+
+# Rows fetched at once by the sql command's cursor.
+SQL_PREFETCH = 100
+
+# Maximum number of pages the sql command shows, the remaining rows aren't read.
+SQL_MAX_PAGES = 20
+
+SQL_PAGE_LENGTH = 1900
+
+SQL_ROW_WIDTH = 200
+
 
 class Arguments(ArgumentParser):
     def error(self, message):
@@ -244,35 +264,114 @@ class Owner(commands.Cog):
         ret = ret.decode("utf-8").strip()
         await msg.edit(content=f"""```prolog\n{ret}```""")
 
+    def make_sql_page(self, lines, *, footer=None):
+        embed = discord.Embed(color=self.bot.color)
+        embed.description = "```\n" + "\n".join(lines) + "```"
+        if footer:
+            embed.set_footer(text=footer)
+        return embed
+
+    async def fetch_sql_pages(self, conn, statement):
+        """Stream the rows through a cursor into pages, up to SQL_MAX_PAGES."""
+        columns = [attr.name for attr in statement.get_attributes()]
+        header = " | ".join(columns)[:SQL_ROW_WIDTH]
+        pages, lines, length = [], [header], len(header)
+        rows, truncated = 0, False
+
+        async for row in statement.cursor(prefetch=SQL_PREFETCH):
+            line = " | ".join(str(value) for value in row)[:SQL_ROW_WIDTH]
+            if length + len(line) > SQL_PAGE_LENGTH:
+                pages.append(lines)
+                if len(pages) == SQL_MAX_PAGES:
+                    truncated = True
+                    break
+                lines, length = [header], len(header)
+            lines.append(line)
+            length += len(line) + 1
+            rows += 1
+        else:
+            pages.append(lines)
+
+        footer = f"{rows} rows" + (" (truncated)" if truncated else "")
+        return [self.make_sql_page(page, footer=footer) for page in pages]
+
+    async def explain(self, conn, query):
+        """Run the query with EXPLAIN ANALYZE and roll back its changes."""
+        transaction = conn.transaction()
+        await transaction.start()
+        try:
+            plan = await conn.fetchval(
+                f"EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) {query}"
+            )
+        finally:
+            await transaction.rollback()
+        return self.make_sql_page(summarize_plan(plan))
+
     @commands.command(hidden=True)
     async def sql(self, ctx, *, query: str):
-        """Run a query."""
+        """Run a query.
+
+        Rows are streamed into pages. Use `--explain` before the query to show
+        where the time is spent instead, its changes are rolled back.
+        """
+        explain = query.startswith("--explain")
+        if explain:
+            query = query[len("--explain") :].strip()
         query = self.cleanup_code(query)
+
         async with self.bot.pool.acquire() as conn:
             try:
-                res = await conn.fetch(query)
+                if explain:
+                    return await ctx.send(embed=await self.explain(conn, query))
+                statement = await conn.prepare(query)
+                if not statement.get_attributes():
+                    # outside a transaction, so that VACUUM and the like can run
+                    status = await conn.execute(query)
+                    return await ctx.send(f"```prolog\n{status}```")
+                # cursors only work inside a transaction
+                async with conn.transaction():
+                    pages = await self.fetch_sql_pages(conn, statement)
             except Exception as e:
                 return await ctx.send(f"```prolog\n{e}```")
-            if res:
-                await ctx.send(
-                    f"""```asciidoc\nSuccessful query\n----------------\n\n{res}```"""
-                )
-            else:
-                await ctx.send("There are no results.")
+
+        await self.bot.paginator.Paginator(pages=pages).start(ctx)
+
+    async def get_counters(self):
+        """Returns the row counts and trivia totals kept by the counter table.
+
+        Missing row counts are estimated from the planner statistics.
+        """
+        rows = await self.bot.pool.fetch(queries.GET_COUNTERS)
+        counters = {row["name"]: row["value"] for row in rows}
+
+        missing = [t for t in COUNTED_TABLES if t not in counters]
+        if missing:
+            rows = await self.bot.pool.fetch(queries.GET_ESTIMATED_ROWS, missing)
+            counters.update({row["name"]: f"~{row['value']}" for row in rows})
+
+        if "trivia_started" not in counters:
+            totals = await self.bot.pool.fetchrow(queries.GET_TRIVIA_TOTALS)
+            for name, value in zip(TRIVIA_COUNTERS, totals):
+                counters[name] = value
+        return counters
 
     @commands.command(hidden=True)
     async def admin(self, ctx):
         """Display an admin panel."""
         try:
-            profiles = await self.bot.pool.fetchval("SELECT COUNT(*) FROM profile;")
+            counters = await self.get_counters()
+            profiles = counters["profile"]
             prefixes = self.bot.prefixes
-            guilds = await self.bot.pool.fetchval("SELECT COUNT(*) FROM server;")
-            ratings = await self.bot.pool.fetchval("SELECT COUNT(*) FROM rating;")
-            nicknames = await self.bot.pool.fetchval("SELECT COUNT(*) FROM nickname")
+            guilds = counters["server"]
+            ratings = counters["rating"]
+            nicknames = counters["nickname"]
 
             total_commands = await self.bot.total_commands()
-            played, won, lost, contribs = await self.bot.pool.fetchrow(
-                "SELECT SUM(started), SUM(won), SUM(lost), SUM(contribs) FROM trivia;"
+            played, won, lost, contribs = (
+                counters["trivia_started"],
+                counters["trivia_won"],
+                counters["trivia_lost"],
+                counters["trivia_contribs"],
             )
             # Bot entries
             bot_entries = (
@@ -309,6 +408,77 @@ class Owner(commands.Cog):
         except Exception as e:
             await ctx.send(f"""```prolog\n{type(e).__name__}\n{e}```""")
 
+    @commands.command(hidden=True)
+    async def usage(self, ctx, hours: int = 24):
+        """Display the most used commands and their latency.
+
+        The last 48 hours are available.
+        """
+        hours = min(hours, 48)
+        since = datetime.datetime.utcnow() - datetime.timedelta(hours=hours)
+        rows = await self.bot.pool.fetch(queries.GET_RECENT_COMMAND_USAGE, since)
+        if not rows:
+            return await ctx.send("There are no results.")
+
+        lines = []
+        for row in rows[:20]:
+            lines.append(
+                f"{row['command']:20} {row['uses']:>6} uses {row['failures']:>4} failed "
+                f"{row['latency'] * 1000:>8.0f}ms avg {row['latency_max'] * 1000:>8.0f}ms max"
+            )
+        value = "\n".join(lines)
+        await ctx.send(f"```\nLast {hours} hours\n\n{value[:1900]}```")
+
+    @commands.command(hidden=True)
+    async def pool(self, ctx):
+        """Display database pool statistics and the slowest queries."""
+        pool = self.bot.pool
+        wait = pool.acquire_wait
+        embed = discord.Embed(color=ctx.author.color)
+        embed.title = "Database Pool"
+        embed.description = (
+            f"Connections: **{pool.leased}/{pool.limit}** leased, "
+            f"{pool.size} open (bounds {pool.min_size}-{pool.max_size}, "
+            f"peak {pool.peak_in_use})\n"
+            f"Saturation: **{pool.saturation:.0%}** | waiting: {pool.waiting} | "
+            f"shed: {pool.shed} | resizes: {pool.resizes}\n"
+            f"Acquire wait: mean **{wait.mean * 1000:.2f}ms** | "
+            f"p95 **{wait.percentile(95) * 1000:.0f}ms** | "
+            f"max **{wait.max * 1000:.2f}ms**"
+        )
+        if pool.replica_options:
+            lag = "down" if pool.replica_lag is None else f"{pool.replica_lag:.1f}s"
+            status = "in use" if pool.replica_available else "bypassed"
+            embed.description += (
+                f"\nReplica: **{status}** (lag {lag}, "
+                f"max {pool.max_replica_lag:.0f}s, "
+                f"{pool.replica_fallbacks} fallbacks)"
+            )
+
+        for stats in pool.get_top_statements():
+            timings = stats.timings
+            embed.add_field(
+                name=textwrap.shorten(stats.query, width=100),
+                value=(
+                    f"calls: {timings.count} | errors: {stats.errors}\n"
+                    f"total: {timings.total:.2f}s | mean: {timings.mean * 1000:.2f}ms\n"
+                    f"p95: {timings.percentile(95) * 1000:.0f}ms | "
+                    f"max: {timings.max * 1000:.2f}ms"
+                ),
+                inline=False,
+            )
+
+        slow = []
+        for query in reversed(pool.slow_queries):
+            params = ", ".join(query.params)
+            slow.append(
+                f"{query.duration * 1000:.0f}ms {textwrap.shorten(query.query, width=60)} {params}"
+            )
+        if slow:
+            value = "\n".join(slow[:5])
+            embed.add_field(name="Slow queries", value=f"```{value[:1000]}```")
+        await ctx.send(embed=embed)
+
     def get_backup_arguments(self, args):
         import shlex
 
@@ -330,18 +500,26 @@ class Owner(commands.Cog):
             return await ctx.send(e)
 
         try:
-            await asyncio.create_subprocess_shell(
-                "pg_dump -U davide overbot > ../backup.sql",
-                stdout=asyncio.subprocess.PIPE,
-                stderr=asyncio.subprocess.PIPE,
-            )
-            await msg.add_reaction("✅")
+            result = await create_backup(self.bot.pool, **self.bot.config.backup)
         except Exception as e:
-            await msg.edit(content=f"""```prolog\n{e}```""")
+            return await msg.edit(content=f"""```prolog\n{e}```""")
+
+        await msg.edit(
+            content=(
+                f"Backup `{os.path.basename(result.path)}` generated in "
+                f"{result.duration:.2f}s: {result.tables} tables, {result.rows} rows, "
+                f"{result.size / 1024 ** 2:.2f}MB "
+                f"({result.compressed_size / 1024 ** 2:.2f}MB compressed) at "
+                f"{result.throughput / 1024 ** 2:.2f}MB/s"
+            )
+        )
+        await msg.add_reaction("✅")
 
         if args.file:
-            await asyncio.sleep(2)  # wait for the file to be created or updated.
-            await ctx.send(file=discord.File("../backup.sql"), delete_after=15)
+            try:
+                await ctx.send(file=discord.File(result.path), delete_after=15)
+            except discord.HTTPException as e:
+                await ctx.send(f"""```prolog\n{e}```""")
 
 
 def setup(bot):
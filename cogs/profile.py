@@ -4,10 +4,13 @@ from contextlib import suppress
 import discord
 from discord.ext import commands
 
+from utils import queries
 from utils.i18n import _, locale
-from utils.checks import has_profile, can_add_profile
+from utils.cache import LRUCache
+from utils.checks import ProfileLimitReached, has_profile, can_add_profile
 from utils.player import Player, NoStatistics, NoHeroStatistics
 from utils.request import Request, RequestError
+from utils.profiles import MAX_PROFILES, invalidate, get_member_profiles
 from utils.paginator import Link, Update
 from classes.converters import Hero, Index
 
@@ -38,58 +41,49 @@ class Profile(commands.Cog):
             "xbl": "<:xbl:679469487623503930>",
             "nintendo-switch": "<:nsw:752653766377078817>",
         }
+        # whether members have their SR in their nickname
+        self.nicknames = LRUCache(maxsize=10_000, ttl=3600.0)
+        self.bot.bus.subscribe("nickname", self.on_nickname_change)
+
+    def cog_unload(self):
+        self.bot.bus.unsubscribe("nickname", self.on_nickname_change)
 
     async def get_profiles(self, member):
-        query = """SELECT profile.id, platform, username
-                FROM profile
-                INNER JOIN member
-                        ON member.id = profile.member_id
-                WHERE member.id = $1;
-                """
-        profiles = await self.bot.pool.fetch(query, member.id)
+        profiles = await get_member_profiles(self.bot, member.id)
         if not profiles:
             raise MemberHasNoProfile(member)
         return profiles
 
-    async def get_profile(self, member, *, index):
+    async def get_profile(self, member, *, index, profiles=None):
+        profiles = profiles or await self.get_profiles(member)
         if index:
-            profiles = await self.get_profiles(member)
-            profile = profiles[abs(index) - 1]
-        else:
-            query = """SELECT profile.id, platform, username
-                    FROM profile
-                    INNER JOIN member
-                            ON member.main_profile = profile.id
-                    WHERE member.id = $1;
-                    """
-            profile = await self.bot.pool.fetchrow(query, member.id)
+            return profiles.get(index)
+        profile = profiles.main
         if not profile:
             raise MemberHasNoProfile(member)
         return profile
 
     async def set_main_profile(self, member_id, *, profile_id):
-        query = "UPDATE member SET main_profile = $1 WHERE id = $2;"
-        await self.bot.pool.execute(query, profile_id, member_id)
-
-    async def is_main_profile(self, member_id, *, profile_id):
-        query = "SELECT main_profile FROM member WHERE id = $1;"
-        return await self.bot.pool.fetchval(query, member_id) == profile_id
-
-    async def has_main_profile(self, member_id):
-        query = "SELECT main_profile FROM member WHERE id = $1;"
-        if await self.bot.pool.fetchval(query, member_id):
-            return True
-        return False
+        await self.bot.pool.execute(queries.SET_MAIN_PROFILE, profile_id, member_id)
+        await invalidate(self.bot, member_id)
 
-    async def insert_profile(self, platform, username, *, member_id):
-        query = "INSERT INTO profile(platform, username, member_id) VALUES($1, $2, $3);"
-        await self.bot.pool.execute(query, platform, username, member_id)
-
-    async def update_profile(self, platform, username, *, profile_id):
-        query = "UPDATE profile SET platform = $1, username = $2 WHERE id = $3;"
-        await self.bot.pool.execute(query, platform, username, profile_id)
+    async def link_profile(self, platform, username, *, member_id):
+        """Link a profile and returns its id, index and whether it's the main one."""
+        row = await self.bot.pool.fetchrow(
+            queries.LINK_PROFILE, platform, username, member_id, MAX_PROFILES
+        )
+        if not row:
+            raise ProfileLimitReached()
+        await invalidate(self.bot, member_id)
+        return row
+
+    async def update_profile(self, platform, username, *, profile_id, member_id):
+        await self.bot.pool.execute(
+            queries.UPDATE_PROFILE, platform, username, profile_id
+        )
+        await invalidate(self.bot, member_id)
 
-    async def list_profiles(self, profiles, member):
+    def list_profiles(self, profiles, member):
         embed = discord.Embed(color=member.color)
         embed.set_author(name=str(member), icon_url=member.avatar_url)
         embed.set_footer(
@@ -98,13 +92,10 @@ class Profile(commands.Cog):
             )
         )
         description = []
-        for index, (id, platform, username) in enumerate(profiles, start=1):
-            if platform == "pc":
-                username = username.replace("-", "#")
-            if not await self.is_main_profile(member.id, profile_id=id):
-                fmt = f"{index}. {platform} - {username}"
-            else:
-                fmt = f"{index}. {platform} - {username} :star:"
+        for profile in profiles:
+            fmt = f"{profile.index}. {profile.platform} - {profile.display_name}"
+            if profile.is_main:
+                fmt += " :star:"
             description.append(fmt)
         embed.description = "\n".join(description)
         return embed
@@ -135,9 +126,18 @@ class Profile(commands.Cog):
         else:
             return message.content.replace("#", "-")
 
+    def on_nickname_change(self, member_id, value):
+        if member_id is None:
+            self.nicknames.clear()
+        else:
+            self.nicknames.pop(member_id)
+
     async def has_nickname(self, member_id):
-        query = "SELECT id FROM nickname WHERE id = $1;"
-        return await self.bot.pool.fetchval(query, member_id)
+        nickname = self.nicknames.get(member_id)
+        if nickname is None:
+            nickname = await self.bot.pool.fetchval(queries.HAS_NICKNAME, member_id)
+            nickname = self.nicknames[member_id] = nickname is not None
+        return nickname
 
     async def make_nickname(self, member, *, profile):
         ratings = profile.resolve_ratings()
@@ -184,18 +184,20 @@ class Profile(commands.Cog):
             )
 
         if not remove:
-            query = (
-                "INSERT INTO nickname(id, server_id, profile_id) VALUES($1, $2, $3);"
+            await self.bot.pool.execute(
+                queries.INSERT_NICKNAME, member.id, ctx.guild.id, profile_id
             )
-            await self.bot.pool.execute(query, member.id, ctx.guild.id, profile_id)
+            self.nicknames[member.id] = True
+            await self.bot.bus.publish("nickname", member.id)
             await ctx.send(
                 _(
                     "Nickname successfully set. Your SR will now be visible in your nickname within this server."
                 )
             )
         else:
-            query = "DELETE FROM nickname WHERE id = $1;"
-            await self.bot.pool.execute(query, member.id)
+            await self.bot.pool.execute(queries.DELETE_NICKNAME, member.id)
+            self.nicknames[member.id] = False
+            await self.bot.bus.publish("nickname", member.id)
             await ctx.send(_("Nickname successfully removed."))
 
     async def update_nickname_sr(self, member, *, profile):
@@ -228,14 +230,9 @@ class Profile(commands.Cog):
             return
 
         try:
-            await self.insert_profile(platform, username, member_id=ctx.author.id)
-            if not await self.has_main_profile(ctx.author.id):
-                # if the player has no profiles linked, that means he doesn't
-                # have a main_profile as well. Then we can just set the first
-                # profile linked as the main one.
-                query = "SELECT id FROM profile WHERE member_id = $1;"
-                profile_id = await self.bot.pool.fetchval(query, ctx.author.id)
-                await self.set_main_profile(ctx.author.id, profile_id=profile_id)
+            await self.link_profile(platform, username, member_id=ctx.author.id)
+        except ProfileLimitReached:
+            raise
         except Exception as e:
             await ctx.send(embed=self.bot.embed_exception(e))
         else:
@@ -257,8 +254,9 @@ class Profile(commands.Cog):
         You can't unlink your main profile if you have more than 1 profile linked.
         """
         )
+        profiles = await self.get_profiles(ctx.author)
         try:
-            id, platform, username = await self.get_profile(ctx.author, index=index)
+            profile = await self.get_profile(ctx.author, index=index, profiles=profiles)
         except IndexError:
             return await ctx.send(
                 _(
@@ -266,31 +264,28 @@ class Profile(commands.Cog):
                 ).format(prefix=ctx.prefix)
             )
 
-        profiles = await self.get_profiles(ctx.author)
-        if (
-            await self.is_main_profile(ctx.author.id, profile_id=id)
-            and len(profiles) > 1
-        ):
+        if profile.is_main and len(profiles) > 1:
             message = _(
                 "You can't unlink your main profile if you have multiple profiles set. "
                 'Use "{prefix}help profile main" for more info.'
             ).format(prefix=ctx.prefix)
             return await ctx.send(message)
 
-        if platform == "pc":
-            username = username.replace("-", "#")
-
         if not await ctx.prompt(
             _(
                 "Are you sure you want to unlink the following profile?\n"
                 "Platform: `{platform}`\n"
                 "Username: `{username}`"
-            ).format(platform=platform, username=username)
+            ).format(platform=profile.platform, username=profile.display_name)
         ):
             return
 
         try:
-            await self.bot.pool.execute("DELETE FROM profile WHERE id = $1;", id)
+            await self.bot.pool.execute(queries.DELETE_PROFILE, profile.id)
+            await invalidate(self.bot, ctx.author.id)
+            # the nickname is deleted along with the profile
+            self.nicknames.pop(ctx.author.id)
+            await self.bot.bus.publish("nickname", ctx.author.id)
         except Exception as e:
             await ctx.send(embed=self.bot.embed_exception(e))
         else:
@@ -309,7 +304,7 @@ class Profile(commands.Cog):
         )
         try:
             try:
-                id, platform, username = await self.get_profile(ctx.author, index=index)
+                profile = await self.get_profile(ctx.author, index=index)
             except IndexError:
                 return await ctx.send(
                     _(
@@ -318,7 +313,9 @@ class Profile(commands.Cog):
                 )
 
             title = _("Update your Overwatch profile")
-            platform = await Update(platform, username, title=title).start(ctx)
+            platform = await Update(
+                profile.platform, profile.username, title=title
+            ).start(ctx)
             username = await self.get_player_username(ctx, platform)
 
             if not username:
@@ -328,7 +325,9 @@ class Profile(commands.Cog):
                 username = username.replace("-", "#")
 
             try:
-                await self.update_profile(platform, username, profile_id=id)
+                await self.update_profile(
+                    platform, username, profile_id=profile.id, member_id=ctx.author.id
+                )
             except Exception as e:
                 await ctx.send(embed=self.bot.embed_exception(e))
             else:
@@ -353,7 +352,7 @@ class Profile(commands.Cog):
         """
         )
         try:
-            id, platform, username = await self.get_profile(ctx.author, index=index)
+            profile = await self.get_profile(ctx.author, index=index)
         except IndexError:
             return await ctx.send(
                 _(
@@ -361,11 +360,11 @@ class Profile(commands.Cog):
                 ).format(prefix=ctx.prefix)
             )
 
-        await self.set_main_profile(ctx.author.id, profile_id=id)
+        await self.set_main_profile(ctx.author.id, profile_id=profile.id)
         embed = discord.Embed(color=ctx.author.color)
         embed.description = _("Main profile successfully set to:")
-        embed.add_field(name=_("Platform"), value=platform)
-        embed.add_field(name=_("Username"), value=username)
+        embed.add_field(name=_("Platform"), value=profile.platform)
+        embed.add_field(name=_("Username"), value=profile.username)
         await ctx.send(embed=embed)
 
     @has_profile()
@@ -388,7 +387,7 @@ class Profile(commands.Cog):
         except MemberHasNoProfile as e:
             return await ctx.send(e)
 
-        embed = await self.list_profiles(profiles, member)
+        embed = self.list_profiles(profiles, member)
         await ctx.send(embed=embed)
 
     @has_profile()
@@ -412,7 +411,7 @@ class Profile(commands.Cog):
             member = member or ctx.author
 
             try:
-                id, platform, username = await self.get_profile(member, index=index)
+                linked = await self.get_profile(member, index=index)
             except MemberHasNoProfile as e:
                 return await ctx.send(e)
             except IndexError:
@@ -423,15 +422,17 @@ class Profile(commands.Cog):
                 )
 
             try:
-                data = await Request(platform=platform, username=username).get()
+                data = await Request(
+                    platform=linked.platform, username=linked.username
+                ).get()
             except RequestError as e:
                 return await ctx.send(e)
 
-            profile = Player(data, platform=platform, username=username)
+            profile = Player(data, platform=linked.platform, username=linked.username)
             if profile.is_private:
                 embed = profile.private()
             else:
-                embed = await profile.get_ratings(ctx, save=True, profile_id=id)
+                embed = await profile.get_ratings(ctx, save=True, profile_id=linked.id)
                 # if the index is None that means it's the main profile
                 if not index and member.id == ctx.author.id:
                     await self.update_nickname_sr(ctx.author, profile=profile)
@@ -458,8 +459,7 @@ class Profile(commands.Cog):
             member = member or ctx.author
 
             try:
-                # using 'unused' instead of '_' since it conflicts with gettext _()
-                unused, platform, username = await self.get_profile(member, index=index)
+                linked = await self.get_profile(member, index=index)
             except MemberHasNoProfile as e:
                 return await ctx.send(e)
             except IndexError:
@@ -470,11 +470,13 @@ class Profile(commands.Cog):
                 )
 
             try:
-                data = await Request(platform=platform, username=username).get()
+                data = await Request(
+                    platform=linked.platform, username=linked.username
+                ).get()
             except RequestError as e:
                 return await ctx.send(e)
 
-            profile = Player(data, platform=platform, username=username)
+            profile = Player(data, platform=linked.platform, username=linked.username)
             if profile.is_private:
                 embed = profile.private()
             else:
@@ -508,7 +510,7 @@ class Profile(commands.Cog):
             member = member or ctx.author
 
             try:
-                unused, platform, username = await self.get_profile(member, index=index)
+                linked = await self.get_profile(member, index=index)
             except MemberHasNoProfile as e:
                 return await ctx.send(e)
             except IndexError:
@@ -519,11 +521,13 @@ class Profile(commands.Cog):
                 )
 
             try:
-                data = await Request(platform=platform, username=username).get()
+                data = await Request(
+                    platform=linked.platform, username=linked.username
+                ).get()
             except RequestError as e:
                 return await ctx.send(e)
 
-            profile = Player(data, platform=platform, username=username)
+            profile = Player(data, platform=linked.platform, username=linked.username)
             if profile.is_private:
                 embed = profile.private()
             else:
@@ -563,18 +567,22 @@ class Profile(commands.Cog):
                     )
                 )
 
-            id, platform, username = await self.get_profile(ctx.author, index=None)
+            linked = await self.get_profile(ctx.author, index=None)
             try:
-                data = await Request(platform=platform, username=username).get()
+                data = await Request(
+                    platform=linked.platform, username=linked.username
+                ).get()
             except RequestError as e:
                 return await ctx.send(e)
 
-            profile = Player(data, platform=platform, username=username)
+            profile = Player(data, platform=linked.platform, username=linked.username)
             if profile.is_private:
                 return await ctx.send(embed=profile.private())
 
             try:
-                await self.set_or_remove_nickname(ctx, profile=profile, profile_id=id)
+                await self.set_or_remove_nickname(
+                    ctx, profile=profile, profile_id=linked.id
+                )
             except Exception as e:
                 await ctx.send(e)
         else:
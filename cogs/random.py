@@ -4,6 +4,7 @@ import discord
 from discord.ext import commands
 
 from utils.i18n import _, locale
+from utils.catalog import CatalogNotLoaded
 from classes.converters import MapCategory, HeroCategory
 
 ROLES = [
@@ -34,10 +35,6 @@ class Random(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
 
-    async def get(self, url):
-        async with self.bot.session.get(url) as r:
-            return await r.json()
-
     @staticmethod
     def get_hero_color(hero):
         if hero["role"] == "tank":
@@ -46,20 +43,8 @@ class Random(commands.Cog):
             return 0xE61B23
         return 0x13A549
 
-    @staticmethod
-    def filter_by_category(items, *, path, category):
-        return [i for i in items if i[path] == category]
-
-    async def get_random_hero(self, category):
-        heroes = await self.get(self.bot.config.random["hero"])
-
-        if not category:
-            random_hero = secrets.choice(heroes)
-        else:
-            categorized_heroes = self.filter_by_category(
-                heroes, path="role", category=category
-            )
-            random_hero = secrets.choice(categorized_heroes)
+    def get_random_hero(self, category):
+        random_hero = self.bot.catalog.random_hero(category or None)
 
         embed = discord.Embed(color=self.get_hero_color(random_hero))
         embed.title = random_hero["name"].upper()
@@ -83,16 +68,8 @@ class Random(commands.Cog):
         embed.set_thumbnail(url=random_role["icon"])
         return embed
 
-    async def get_random_map(self, category):
-        maps = await self.get(self.bot.config.random["map"])
-
-        if not category:
-            random_map = secrets.choice(maps)
-        else:
-            categorized_maps = self.filter_by_category(
-                maps, path="type", category=category
-            )
-            random_map = secrets.choice(categorized_maps)
+    def get_random_map(self, category):
+        random_map = self.bot.catalog.random_map(category or None)
 
         embed = discord.Embed()
         embed.title = random_map["name"]["en_US"]
@@ -127,7 +104,11 @@ class Random(commands.Cog):
         """
         )
         try:
-            embed = await self.get_random_hero(category)
+            embed = self.get_random_hero(category)
+        except CatalogNotLoaded:
+            await ctx.send(
+                _("The heroes aren't available yet. Please try again in a few minutes.")
+            )
         except IndexError:
             await ctx.send(
                 _(
@@ -170,7 +151,11 @@ class Random(commands.Cog):
         """
         )
         try:
-            embed = await self.get_random_map(category)
+            embed = self.get_random_map(category)
+        except CatalogNotLoaded:
+            await ctx.send(
+                _("The maps aren't available yet. Please try again in a few minutes.")
+            )
         except IndexError:
             await ctx.send(
                 _(
@@ -1,6 +1,7 @@
 import discord
 from discord.ext import commands
 
+from utils import queries
 from utils.i18n import _, locale
 
 
@@ -15,9 +16,8 @@ class Server(commands.Cog):
             del self.bot.prefixes[ctx.guild.id]
         else:
             self.bot.prefixes[ctx.guild.id] = prefix
-        await self.bot.pool.execute(
-            "UPDATE server SET prefix = $1 WHERE id = $2;", prefix, ctx.guild.id
-        )
+        await self.bot.pool.execute(queries.SET_PREFIX, prefix, ctx.guild.id)
+        await self.bot.bus.publish("prefix", ctx.guild.id, prefix)
         await ctx.send(_("Prefix successfully set to `{prefix}`").format(prefix=prefix))
 
     @commands.command()
@@ -42,9 +42,7 @@ class Server(commands.Cog):
                     _("`Manage Server` permission is required to change the prefix.")
                 )
         else:
-            pre = await self.bot.pool.fetchval(
-                "SELECT prefix FROM server WHERE id = $1;", ctx.guild.id
-            )
+            pre = await self.bot.pool.fetchval(queries.GET_PREFIX, ctx.guild.id)
             embed = discord.Embed(color=self.bot.color)
             embed.set_footer(
                 text=_('Use "{prefix}prefix value" to change it.').format(
@@ -79,20 +77,15 @@ class Server(commands.Cog):
         )
         async with ctx.typing():
             try:
-                query = """SELECT id, commands_run
-                        FROM server
-                        WHERE id <> ALL($1::bigint[])
-                        ORDER BY commands_run DESC LIMIT 5;
-                        """
-                guilds = await self.bot.pool.fetch(
-                    query, self.bot.config.ignored_guilds
-                )
+                guilds = await self.bot.get_leaderboard(self.bot.server_board, 5)
                 embed = discord.Embed()
                 embed.title = _("Most Active Servers")
                 embed.url = self.bot.config.website
                 embed.set_footer(text=_("Tracking command usage since - 11/26/2020"))
 
                 board = []
+                # guilds that are unavailable or run by another process are skipped
+                guilds = [g for g in guilds if self.bot.get_guild(g["id"])]
                 for index, guild in enumerate(guilds, start=1):
                     cur_guild = self.bot.get_guild(guild["id"])
                     placement = self.get_placement(index)
@@ -111,7 +104,7 @@ class Server(commands.Cog):
                         joined_on=joined_on,
                     )
 
-                    if index < 5:
+                    if index < len(guilds):
                         board.append("-----------")
 
                 embed.description = "\n".join(board)
@@ -1,21 +1,45 @@
 import re
+import datetime
 import platform
 from contextlib import suppress
 
 import distro
 import psutil
 import discord
+from termcolor import colored
 from discord.ext import tasks, commands
 
+from utils import queries
+from utils.pool import PoolSaturated
+from utils.usage import rollup_usage
+from utils.rating import maintain_ratings
 from utils.scrape import get_overwatch_news
+from utils.questions import CHECK_INTERVAL
+from utils.retention import purge_inactive_members
+
+# Above this number of deleted members, the other processes are told to
+# clear their caches instead of being sent every member.
+MAX_PUBLISHED_MEMBERS = 20
 
 
 class Tasks(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
+        self.command_usage = None
         self.update.start()
         self.statistics.start()
         self.send_overwatch_news.start()
+        self.rating_partitions.start()
+        self.leaderboards.start()
+        self.replica_health.start()
+        self.pool_size.start()
+        self.bus_connection.start()
+        self.flush_usage.start()
+        self.flush_trivia_games.start()
+        self.command_usage_rollup.start()
+        self.retention.start()
+        self.catalog.start()
+        self.questions.start()
 
     def get_shards(self):
         shards = []
@@ -34,7 +58,7 @@ class Tasks(commands.Cog):
         return shards
 
     async def get_bot_statistics(self):
-        total_commands = await self.bot.total_commands()
+        total_commands = await self.bot.total_commands(background=True)
         try:
             total_members = sum(guild.member_count for guild in self.bot.guilds)
         except AttributeError:
@@ -45,7 +69,7 @@ class Tasks(commands.Cog):
             shards = self.get_shards()
             ping = f"{round(self.bot.latency * 1000, 2)}ms"
 
-        async with self.bot.pool.acquire() as conn:
+        async with self.bot.pool.acquire(background=True) as conn:
             pg_version = conn.get_server_version()
         pg_version = f"{pg_version.major}.{pg_version.micro} {pg_version.releaselevel}"
         py_version = platform.python_version()
@@ -82,11 +106,29 @@ class Tasks(commands.Cog):
         }
         return statistics
 
+    async def load_command_usage(self):
+        """Cache the usage of the last 30 days, it changes with every rollup."""
+        today = datetime.datetime.utcnow().replace(
+            hour=0, minute=0, second=0, microsecond=0
+        )
+        rows = await self.bot.pool.fetch(
+            queries.GET_COMMAND_USAGE,
+            today - datetime.timedelta(days=30),
+            today,
+            background=True,
+        )
+        self.command_usage = {row["command"]: row for row in rows}
+
     async def get_bot_commands(self):
+        if self.command_usage is None:
+            await self.load_command_usage()
+        usage = self.command_usage
+
         all_commands = []
         for command in self.bot.walk_commands():
             if command.hidden:
                 continue
+            row = usage.get(command.qualified_name)
             all_commands.append(
                 dict(
                     cog=command.cog_name,
@@ -95,19 +137,19 @@ class Tasks(commands.Cog):
                     signature=command.signature or None,
                     short_desc=command.short_doc or "No help found...",
                     long_desc=command.help or "No help found...",
+                    uses=row["uses"] if row else 0,
+                    latency=round(row["latency"] * 1000, 2) if row else None,
                 )
             )
         return all_commands
 
     async def get_top_servers(self):
-        guilds = await self.bot.pool.fetch(
-            "SELECT id, commands_run FROM server WHERE id <> "
-            "ALL($1::bigint[]) ORDER BY commands_run DESC LIMIT 5;",
-            self.bot.config.ignored_guilds,
-        )
+        guilds = await self.bot.get_leaderboard(self.bot.server_board, 5)
         servers = []
         for guild in guilds:
             g = self.bot.get_guild(guild["id"])
+            if not g:
+                continue
             servers.append(
                 dict(
                     id=g.id,
@@ -133,9 +175,12 @@ class Tasks(commands.Cog):
             "Authorization": self.bot.config.obapi["token"],
         }
 
-        payload_statistics = await self.get_bot_statistics()
-        payload_commands = await self.get_bot_commands()
-        payload_servers = await self.get_top_servers()
+        try:
+            payload_statistics = await self.get_bot_statistics()
+            payload_servers = await self.get_top_servers()
+            payload_commands = await self.get_bot_commands()
+        except PoolSaturated:
+            return
 
         await self.bot.session.post(
             f'{self.bot.config.obapi["url"]}/statistics',
@@ -214,9 +259,14 @@ class Tasks(commands.Cog):
 
         # Returns whether the news_id it's equals to the one stored in the database.
         # If it's equals, that specific news has already been sent.
-        if int(news_id) == await self.bot.pool.fetchval(
-            "SELECT news_id FROM news WHERE id=1;"
-        ):
+        try:
+            last_news_id = await self.bot.pool.fetchval(
+                queries.GET_NEWS_ID, background=True
+            )
+        except PoolSaturated:
+            return
+
+        if int(news_id) == last_news_id:
             return
 
         embed = discord.Embed()
@@ -235,14 +285,159 @@ class Tasks(commands.Cog):
 
         # Once the latest news has been sent, we update the older
         # news_id stored in the database with the new one.
-        await self.bot.pool.execute(
-            "UPDATE news SET news_id=$1 WHERE id=1;", int(news_id)
-        )
+        await self.bot.pool.execute(queries.SET_NEWS_ID, int(news_id))
+
+    @tasks.loop(hours=24.0)
+    async def rating_partitions(self):
+        """Creates, rolls up and detaches rating partitions."""
+        try:
+            created, rolled_up, detached = await maintain_ratings(
+                self.bot.pool, **self.bot.config.rating
+            )
+        except Exception as e:
+            if not isinstance(e, PoolSaturated):
+                print(f"[{colored('ERROR', 'red')}] rating maintenance failed: {e}")
+            # retry in an hour instead of waiting for the next day, the
+            # ratings can't be inserted once the partitions run out
+            self.rating_partitions.change_interval(hours=1.0)
+            return
+        self.rating_partitions.change_interval(hours=24.0)
+        for action, months in (
+            ("created", created),
+            ("rolled up", rolled_up),
+            ("detached", detached),
+        ):
+            if months:
+                months = ", ".join(m.strftime("%Y-%m") for m in months)
+                print(f"[{colored('RATING', 'blue')}] {action}: {months}")
+
+    @tasks.loop(hours=6.0)
+    async def catalog(self):
+        """Download the heroes and maps used by the commands."""
+        # the catalog has just been downloaded at startup
+        if self.catalog.current_loop == 0 and self.bot.catalog.loaded:
+            return
+        # retry sooner while a list couldn't be downloaded
+        if await self.bot.catalog.refresh(self.bot.session):
+            self.catalog.change_interval(hours=6.0)
+        else:
+            self.catalog.change_interval(minutes=5.0)
+
+    @tasks.loop(seconds=CHECK_INTERVAL)
+    async def questions(self):
+        """Reload the trivia questions when their file changes."""
+        trivia = self.bot.get_cog("Trivia")
+        if trivia:
+            await trivia.questions.refresh(loop=self.bot.loop)
+
+    @tasks.loop(minutes=30.0)
+    async def leaderboards(self):
+        """Reload the leaderboards to fix any drift from the database."""
+        with suppress(PoolSaturated):
+            await self.bot.refresh_leaderboards(background=True)
+
+    @tasks.loop(seconds=30.0)
+    async def replica_health(self):
+        """Update the replica lag used to route read-only queries."""
+        await self.bot.pool.check_replica()
+
+    @tasks.loop(seconds=10.0)
+    async def pool_size(self):
+        """Adapt the connection limit to the load."""
+        await self.bot.pool.resize()
+
+    @tasks.loop(seconds=5.0)
+    async def bus_connection(self):
+        """Reconnect the invalidation bus if its connection was lost."""
+        await self.bot.bus.ensure_connected()
+
+    @tasks.loop(minutes=1.0)
+    async def flush_usage(self):
+        """Write the aggregated command usage."""
+        # on failure the usage is kept and written with the next flush
+        try:
+            await self.bot.usage.flush(self.bot.pool)
+        except PoolSaturated:
+            pass
+        except Exception as e:
+            print(f"[{colored('ERROR', 'red')}] command usage flush failed: {e}")
+
+    @tasks.loop(seconds=10.0)
+    async def flush_trivia_games(self):
+        """Write the outcome of the trivia games played since the last flush."""
+        # on failure the games are kept and written with the next flush
+        try:
+            rows = await self.bot.trivia_games.flush(self.bot.pool)
+        except PoolSaturated:
+            return
+        except Exception as e:
+            print(f"[{colored('ERROR', 'red')}] trivia games flush failed: {e}")
+            return
+        for row in rows:
+            self.bot.trivia_board.update(row)
+
+    @tasks.loop(hours=1.0)
+    async def command_usage_rollup(self):
+        """Roll up the command usage into hourly and daily buckets."""
+        # a missed run is caught up by the next one
+        try:
+            await rollup_usage(self.bot.pool)
+            await self.load_command_usage()
+        except PoolSaturated:
+            pass
+        except Exception as e:
+            print(f"[{colored('ERROR', 'red')}] command usage rollup failed: {e}")
+
+    async def forget_members(self, member_ids):
+        profile = self.bot.get_cog("Profile")
+        trivia = self.bot.get_cog("Trivia")
+        for member_id in member_ids:
+            self.bot.profiles.pop(member_id)
+            self.bot.locales.pop(member_id)
+            self.bot.trivia_board.remove(member_id)
+            # or the next flush would insert their trivia row again
+            self.bot.trivia_games.discard(member_id)
+            if profile:
+                profile.nicknames.pop(member_id)
+            if trivia:
+                trivia.seen.pop(member_id)
+
+        # the other processes cache the same members
+        keys = member_ids if len(member_ids) <= MAX_PUBLISHED_MEMBERS else [None]
+        for channel in ("profile", "locale", "nickname"):
+            for key in keys:
+                await self.bot.bus.publish(channel, key)
+
+    @tasks.loop(hours=24.0)
+    async def retention(self):
+        """Delete the data of the members who stopped using the bot."""
+        try:
+            reclaimed = await purge_inactive_members(
+                self.bot.pool,
+                **self.bot.config.retention,
+                on_delete=self.forget_members,
+            )
+        except PoolSaturated:
+            return
+        if reclaimed:
+            rows = ", ".join(f"{amount} {table}" for table, amount in reclaimed.items())
+            print(f"[{colored('RETENTION', 'blue')}] deleted {rows}")
 
     def cog_unload(self):
         self.update.cancel()
         self.statistics.cancel()
         self.send_overwatch_news.cancel()
+        self.rating_partitions.cancel()
+        self.leaderboards.cancel()
+        self.replica_health.cancel()
+        self.pool_size.cancel()
+        self.bus_connection.cancel()
+        self.flush_usage.cancel()
+        self.catalog.cancel()
+        self.questions.cancel()
+        self.flush_trivia_games.cancel()
+        self.command_usage_rollup.cancel()
+        self.retention.cancel()
 
 
 def setup(bot):
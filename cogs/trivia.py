@@ -1,13 +1,36 @@
+import re
 import json
 import random
 import asyncio
-import secrets
+from contextlib import suppress
 
 import discord
 from discord.ext import commands
 
+from utils import queries
 from utils.i18n import _, locale
+from utils.cache import LRUCache
+from utils.games import TriviaGames, TriviaRound
 from utils.paginator import Choose
+from utils.questions import QuestionBank, SeenQuestions, QuestionsUnavailable
+
+# Number of seconds members have to answer in a trivia round.
+ROUND_DURATION = 30.0
+
+# Maximum number of winners mentioned at the end of a trivia round.
+MAX_MENTIONED_WINNERS = 20
+
+# Minimum estimated similarity of a submission and a likely duplicate.
+DUPLICATE_THRESHOLD = 0.6
+
+# Maximum number of likely duplicates listed for a submission.
+MAX_DUPLICATES = 5
+
+
+class InvalidSubmission(Exception):
+    """Exception raised when a submitted question isn't valid."""
+
+    pass
 
 
 class MemberHasNoStats(Exception):
@@ -20,49 +43,46 @@ class MemberHasNoStats(Exception):
 class Trivia(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
-
-    def get_question(self):
-        with open("assets/questions.json") as fp:
-            questions = json.loads(fp.read())
-        shuffled = random.sample(questions, len(questions))
-        return secrets.choice(shuffled)
+        self.questions = QuestionBank()
+        # reloaded in the background by the tasks when the file changes
+        self.questions.load()
+        # questions asked to the members who played recently
+        self.seen = LRUCache(maxsize=10_000)
+        # trivia rounds in progress by message id
+        self.rounds = {}
+
+    async def get_seen_questions(self, member_id):
+        seen = self.seen.get(member_id)
+        if seen is None:
+            pending = self.bot.trivia_games.get(member_id)
+            if pending and pending[3] is not None:
+                data = pending[3]
+            else:
+                data = await self.bot.pool.fetchval(queries.GET_TRIVIA_SEEN, member_id)
+            seen = self.seen[member_id] = SeenQuestions(data)
+        return seen
+
+    async def get_question(self, member_id):
+        seen = await self.get_seen_questions(member_id)
+        return self.questions.random(seen=seen)
 
     async def get_result(self, ctx, question):
-        entries = [question["correct_answer"]] + question["wrong_answers"]
+        entries = question.answers
         shuffled = random.sample(entries, len(entries))
         timeout = 45.0
         footer = _(f"You have 1 try and {timeout} seconds to respond.")
         answer = await Choose(
             shuffled,
             timeout=timeout,
-            title=question["question"],
-            image=question["image_url"],
+            title=question.question,
+            image=question.image_url,
             footer=footer,
         ).start(ctx)
-        return answer == question["correct_answer"]
-
-    async def update_member_games_started(self, member_id):
-        query = """INSERT INTO trivia(id, started)
-                VALUES($1, 1)
-                ON CONFLICT (id) DO
-                UPDATE SET started = trivia.started + 1;"""
-        await self.bot.pool.execute(query, member_id)
-
-    async def update_member_games_won(self, member_id):
-        await self.bot.pool.execute(
-            "UPDATE trivia SET won = won + 1 WHERE id = $1;", member_id
-        )
+        return answer == question.correct_answer
 
-    async def update_member_games_lost(self, member_id):
-        await self.bot.pool.execute(
-            "UPDATE trivia SET lost = lost + 1 WHERE id = $1;", member_id
-        )
-
-    async def update_member_stats(self, member_id, *, won=True):
-        if won:
-            await self.update_member_games_won(member_id)
-        else:
-            await self.update_member_games_lost(member_id)
+    async def record_game(self, member_id, *, won=None):
+        seen = await self.get_seen_questions(member_id)
+        self.bot.trivia_games.record(member_id, won=won, seen=seen.to_bytes())
 
     def embed_result(self, member, *, won=True, correct_answer=None):
         embed = discord.Embed()
@@ -92,27 +112,124 @@ class Trivia(commands.Cog):
     async def play(self, ctx):
         _("""Play Overwatch trivia.""")
         try:
-            question = self.get_question()
+            question = await self.get_question(ctx.author.id)
+        except QuestionsUnavailable:
+            return await ctx.send(
+                _("The questions aren't available right now. Please try again later.")
+            )
         except Exception as e:
-            await ctx.send(embed=self.bot.embed_exception(e))
+            return await ctx.send(embed=self.bot.embed_exception(e))
 
-        await self.update_member_games_started(ctx.author.id)
+        result = None
+        try:
+            result = await self.get_result(ctx, question)
+        finally:
+            # written with the next flush, a game without answer counts as started
+            await self.record_game(ctx.author.id, won=result)
 
-        result = await self.get_result(ctx, question)
         if result:
-            await self.update_member_stats(ctx.author.id)
             await ctx.send(embed=self.embed_result(ctx.author))
         else:
-            await self.update_member_stats(ctx.author.id, won=False)
             embed = self.embed_result(
-                ctx.author, won=False, correct_answer=question["correct_answer"]
+                ctx.author, won=False, correct_answer=question.correct_answer
             )
             await ctx.send(embed=embed)
 
-    async def get_member_trivia_stats(self, member):
-        member_stats = await self.bot.pool.fetchrow(
-            "SELECT * FROM trivia WHERE id = $1;", member.id
+    @commands.Cog.listener()
+    async def on_raw_reaction_add(self, payload):
+        trivia_round = self.rounds.get(payload.message_id)
+        if not trivia_round or payload.user_id == self.bot.user.id:
+            return
+        trivia_round.answer(payload.user_id, str(payload.emoji))
+
+    def embed_round(self, trivia_round):
+        question = trivia_round.question
+        embed = discord.Embed(color=self.bot.color)
+        embed.title = question.question[:256]
+        embed.description = "\n".join(
+            f"{i}. {answer}" for i, answer in enumerate(trivia_round.answers, start=1)
+        )
+        if question.image_url:
+            embed.set_image(url=question.image_url)
+        embed.set_footer(
+            text=_("Everyone has 1 try and {timeout} seconds to respond.").format(
+                timeout=ROUND_DURATION
+            )
+        )
+        return embed
+
+    def embed_round_result(self, trivia_round, results):
+        winners = [member_id for member_id, won in results.items() if won]
+        embed = discord.Embed(color=self.bot.color)
+        embed.title = _("Round over!")
+        embed.add_field(
+            name=_("Correct answer"), value=trivia_round.question.correct_answer
+        )
+        embed.add_field(name=_("Players"), value=len(results))
+        embed.add_field(name=_("Winners"), value=len(winners))
+        if winners:
+            mentions = " ".join(f"<@{i}>" for i in winners[:MAX_MENTIONED_WINNERS])
+            if len(winners) > MAX_MENTIONED_WINNERS:
+                mentions += " ..."
+            embed.description = mentions
+        return embed
+
+    async def record_round(self, results):
+        """Write the outcome of a round with a single statement."""
+        games = TriviaGames()
+        for member_id, won in results.items():
+            games.record(member_id, won=won)
+        try:
+            rows = await games.flush(self.bot.pool)
+        except Exception:
+            # written with the next flush of the bot's trivia games
+            self.bot.trivia_games.merge(games.pending)
+        else:
+            for row in rows:
+                self.bot.trivia_board.update(row)
+
+    @trivia.command(name="round")
+    @commands.guild_only()
+    @commands.cooldown(1, ROUND_DURATION, commands.BucketType.channel)
+    @locale
+    async def _round(self, ctx):
+        _(
+            """Play a trivia round with everyone in the current channel.
+
+        Everyone can answer by reacting to the question, only the first reaction counts.
+
+        A round can be started once every 30 seconds in a channel.
+        """
         )
+        try:
+            question = self.questions.random()
+        except QuestionsUnavailable:
+            return await ctx.send(
+                _("The questions aren't available right now. Please try again later.")
+            )
+        except Exception as e:
+            return await ctx.send(embed=self.bot.embed_exception(e))
+
+        trivia_round = TriviaRound(question)
+        message = await ctx.send(embed=self.embed_round(trivia_round))
+        self.rounds[message.id] = trivia_round
+        try:
+            for reaction in trivia_round.reactions:
+                await message.add_reaction(reaction)
+            await asyncio.sleep(ROUND_DURATION)
+        finally:
+            del self.rounds[message.id]
+
+        with suppress(discord.HTTPException):
+            await message.delete()
+        results = trivia_round.results()
+        await ctx.send(embed=self.embed_round_result(trivia_round, results))
+        if results:
+            await self.record_round(results)
+
+    async def get_member_trivia_stats(self, member):
+        member_stats = await self.bot.pool.fetchrow(queries.GET_TRIVIA_STATS, member.id)
+        member_stats = self.bot.trivia_games.apply(member.id, member_stats)
         if not member_stats:
             raise MemberHasNoStats(member)
         return member_stats
@@ -192,16 +309,15 @@ class Trivia(commands.Cog):
         """
         )
         async with ctx.typing():
-            players = await self.bot.pool.fetch(
-                "SELECT id, started, won, lost FROM trivia WHERE "
-                "id <> 285502621295312896 ORDER BY won DESC LIMIT 10;"
-            )
+            players = await self.bot.get_leaderboard(self.bot.trivia_board, 10)
             embed = discord.Embed()
             embed.title = _("Best Trivia Players")
 
+            users = await self.bot.resolve_users([p["id"] for p in players])
+
             board = []
             for index, player in enumerate(players, start=1):
-                cur_player = await self.bot.fetch_user(player["id"])
+                cur_player = users[player["id"]] or player["id"]
                 placement = self.get_placement(index)
                 ratio = self.get_player_ratio(player["won"], player["lost"])
                 board.append(
@@ -228,18 +344,59 @@ class Trivia(commands.Cog):
         )
 
     async def update_member_contribs_stats(self, member_id):
-        query = """INSERT INTO trivia(id, contribs)
-                VALUES($1, 1)
-                ON CONFLICT (id) DO
-                UPDATE SET contribs = trivia.contribs + 1;
-                """
-        await self.bot.pool.execute(query, member_id)
+        await self.bot.pool.execute(queries.INCREMENT_TRIVIA_CONTRIBS, member_id)
 
     def format_content(self, content):
         if content.startswith("```") and content.endswith("```"):
             return content
         return "```json\n" + content + "```"
 
+    def parse_submission(self, content):
+        # drop the fences and the language of the code block
+        content = re.sub(r"^```\w*\n?|```$", "", content.strip()).strip()
+        if not content.startswith("{"):
+            content = "{" + content + "}"
+        try:
+            data = json.loads(content)
+        except ValueError:
+            raise InvalidSubmission(_("Your request isn't valid JSON."))
+        if not isinstance(data, dict):
+            data = {}
+
+        def is_text(value):
+            return isinstance(value, str) and value.strip()
+
+        wrong_answers = data.get("wrong_answers")
+        if (
+            not is_text(data.get("question"))
+            or not is_text(data.get("correct_answer"))
+            or not isinstance(wrong_answers, list)
+            or not 1 <= len(wrong_answers) <= 4
+            or not all(is_text(answer) for answer in wrong_answers)
+            or data["correct_answer"] in wrong_answers
+            or not (data.get("image_url") is None or isinstance(data["image_url"], str))
+        ):
+            raise InvalidSubmission(
+                _(
+                    "Your request must have a question, a correct answer and 1 to 4 different wrong answers."
+                )
+            )
+        return {
+            "question": data["question"],
+            "image_url": data.get("image_url"),
+            "correct_answer": data["correct_answer"],
+            "wrong_answers": wrong_answers,
+        }
+
+    def format_duplicates(self, duplicates):
+        lines = ["Likely duplicates:"]
+        for score, question in duplicates[:MAX_DUPLICATES]:
+            if isinstance(question, tuple):
+                lines.append(f"`{score:.0%}` an earlier submission")
+            else:
+                lines.append(f"`{score:.0%}` #{question.id} {question.question[:100]}")
+        return "\n".join(lines)
+
     @trivia.command(aliases=["contrib"])
     @commands.cooldown(1, 3600, commands.BucketType.member)
     @locale
@@ -271,10 +428,33 @@ class Trivia(commands.Cog):
         except asyncio.TimeoutError:
             await ctx.send(_("You took too long to submit the request."))
         else:
+            try:
+                submission = self.parse_submission(message.content)
+            except InvalidSubmission as e:
+                return await ctx.send(e)
+
             channel = self.bot.get_channel(self.bot.config.trivia_channel)
             if not channel:
                 return
-            content = self.format_content(message.content)
+            try:
+                duplicates = self.questions.similar(
+                    submission["question"], DUPLICATE_THRESHOLD
+                )
+                # later submissions of the same question are flagged as well
+                self.questions.add_submission(message.id, submission["question"])
+            except QuestionsUnavailable:
+                # forwarded without the likely duplicates rather than lost
+                duplicates = None
+
+            content = self.format_content(
+                json.dumps(submission, indent=4, ensure_ascii=False)
+            )
+            if duplicates:
+                note = self.format_duplicates(duplicates)
+                if len(content) + len(note) < 2000:
+                    content = f"{note}\n{content}"
+                else:
+                    await channel.send(note)
             await channel.send(content)
             await self.update_member_contribs_stats(ctx.author.id)
             await ctx.send(
@@ -4,14 +4,59 @@ DEBUG = True
 """The Bot token."""
 token = "your_bot_token"
 
-"""Database credentials."""
+"""Database credentials.
+
+`replica` is the optional DSN of a read replica that reporting queries are
+sent to.
+"""
 database = {
     "user": "davide",
     "password": "your_password",
     "database": "overbot",
     "host": "localhost",
+    "replica": None,
+}
+
+"""Connection pool bounds, the pool grows and shrinks between them with the load."""
+pool = {
+    "min_size": 5,
+    "max_size": 20,
+    "command_timeout": 60.0,
+}
+
+"""Replication lag (in seconds) above which the replica is bypassed."""
+max_replica_lag = 30.0
+
+"""Rating history retention (in months).
+
+Partitions older than `rollup_after` are rolled up into weekly summaries and
+the ones older than `detach_after` are detached from the rating table.
+"""
+rating = {
+    "rollup_after": 3,
+    "detach_after": 12,
 }
 
+"""Retention of inactive members' data.
+
+Members who haven't run a command for `inactive_days` are deleted, in batches
+adapted to take about `latency_budget` seconds each.
+"""
+retention = {
+    "inactive_days": 365,
+    "batch_size": 500,
+    "latency_budget": 0.2,
+}
+
+"""Where the database backups are written and how many of them are kept."""
+backup = {
+    "directory": "../backups",
+    "keep": 7,
+}
+
+"""Queries slower than this (in seconds) are added to the slow query log."""
+slow_query_threshold = 0.25
+
 # IGNORE (you don't actually need them to run the bot)
 # NOTE: DEBUG must be set to True though
 
@@ -0,0 +1,30 @@
+-- no-transaction
+-- Indexes backing the lookups run by the cogs. They are built concurrently so
+-- that applying them on a live database doesn't block writes.
+
+-- utils/checks.py, Profile.get_profiles and the profile FK cascade
+CREATE INDEX CONCURRENTLY IF NOT EXISTS profile_member_id_idx
+    ON public.profile (member_id);
+
+-- member.main_profile is set to NULL whenever a profile is unlinked
+CREATE INDEX CONCURRENTLY IF NOT EXISTS member_main_profile_idx
+    ON public.member (main_profile);
+
+-- Player.save_ratings and the rating FK cascade
+CREATE INDEX CONCURRENTLY IF NOT EXISTS rating_profile_id_date_idx
+    ON public.rating (profile_id, date);
+
+-- Trivia.best
+CREATE INDEX CONCURRENTLY IF NOT EXISTS trivia_won_idx
+    ON public.trivia (won DESC);
+
+-- Server.leaderboard and Tasks.get_top_servers
+CREATE INDEX CONCURRENTLY IF NOT EXISTS server_commands_run_idx
+    ON public.server (commands_run DESC);
+
+-- nickname FK cascades from server and profile
+CREATE INDEX CONCURRENTLY IF NOT EXISTS nickname_server_id_idx
+    ON public.nickname (server_id);
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS nickname_profile_id_idx
+    ON public.nickname (profile_id);
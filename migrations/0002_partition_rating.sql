@@ -0,0 +1,82 @@
+-- Turn rating into a table partitioned by month on date, and add the weekly
+-- summaries old partitions are rolled up into before being detached.
+
+CREATE FUNCTION public.create_rating_partition(month date) RETURNS void
+    LANGUAGE plpgsql
+    AS $$
+DECLARE
+    start_date date := date_trunc('month', month)::date;
+BEGIN
+    EXECUTE format(
+        'CREATE TABLE IF NOT EXISTS public.%I PARTITION OF public.rating '
+        'FOR VALUES FROM (%L) TO (%L)',
+        'rating_' || to_char(start_date, 'YYYY_MM'),
+        start_date,
+        (start_date + interval '1 month')::date
+    );
+END;
+$$;
+
+ALTER TABLE public.rating RENAME TO rating_old;
+ALTER TABLE public.rating_old RENAME CONSTRAINT rating_pkey TO rating_old_pkey;
+ALTER INDEX IF EXISTS public.rating_profile_id_date_idx
+    RENAME TO rating_old_profile_id_date_idx;
+
+CREATE TABLE public.rating (
+    id integer DEFAULT nextval('public.rating_id_seq'::regclass) NOT NULL,
+    tank smallint,
+    damage smallint,
+    support smallint,
+    date date DEFAULT CURRENT_DATE NOT NULL,
+    profile_id integer,
+    CONSTRAINT rating_pkey PRIMARY KEY (id, date),
+    CONSTRAINT rating_fkey FOREIGN KEY (profile_id) REFERENCES public.profile(id)
+        ON UPDATE CASCADE ON DELETE CASCADE
+) PARTITION BY RANGE (date);
+
+CREATE INDEX rating_profile_id_date_idx ON public.rating (profile_id, date);
+
+ALTER SEQUENCE public.rating_id_seq OWNED BY public.rating.id;
+
+DO $$
+DECLARE
+    month date := date_trunc(
+        'month', COALESCE((SELECT min(date) FROM public.rating_old), CURRENT_DATE)
+    );
+BEGIN
+    WHILE month <= CURRENT_DATE + interval '2 months' LOOP
+        PERFORM public.create_rating_partition(month);
+        month := month + interval '1 month';
+    END LOOP;
+END;
+$$;
+
+INSERT INTO public.rating(id, tank, damage, support, date, profile_id)
+SELECT id, tank, damage, support, COALESCE(date, CURRENT_DATE), profile_id
+FROM public.rating_old;
+
+DROP TABLE public.rating_old;
+
+CREATE TABLE public.rating_weekly (
+    profile_id integer NOT NULL,
+    week date NOT NULL,
+    tank_min smallint,
+    tank_max smallint,
+    tank_last smallint,
+    damage_min smallint,
+    damage_max smallint,
+    damage_last smallint,
+    support_min smallint,
+    support_max smallint,
+    support_last smallint,
+    CONSTRAINT rating_weekly_pkey PRIMARY KEY (profile_id, week),
+    CONSTRAINT rating_weekly_fkey FOREIGN KEY (profile_id) REFERENCES public.profile(id)
+        ON UPDATE CASCADE ON DELETE CASCADE
+);
+
+-- Months whose partition has already been rolled up into rating_weekly.
+CREATE TABLE public.rating_rollup (
+    month date NOT NULL,
+    rolled_up_at timestamp with time zone DEFAULT now() NOT NULL,
+    CONSTRAINT rating_rollup_pkey PRIMARY KEY (month)
+);
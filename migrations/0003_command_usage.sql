@@ -0,0 +1,18 @@
+-- Per-command usage time series. Rows are aggregated per minute by the bot,
+-- then rolled up into hourly and daily buckets. guild_id is 0 for DMs.
+
+CREATE TABLE public.command_usage (
+    bucket timestamp NOT NULL,
+    command text NOT NULL,
+    guild_id bigint NOT NULL,
+    locale text NOT NULL,
+    outcome text NOT NULL,
+    uses integer NOT NULL,
+    latency_sum double precision NOT NULL,
+    latency_max double precision NOT NULL,
+    PRIMARY KEY (bucket, command, guild_id, locale, outcome)
+);
+
+CREATE TABLE public.command_usage_hourly (LIKE public.command_usage INCLUDING ALL);
+
+CREATE TABLE public.command_usage_daily (LIKE public.command_usage INCLUDING ALL);
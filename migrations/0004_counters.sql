@@ -0,0 +1,80 @@
+-- Row counts and trivia totals kept up to date by triggers, so that the
+-- admin panel doesn't need to scan the tables.
+
+CREATE TABLE public.counter (
+    name text PRIMARY KEY,
+    value bigint DEFAULT 0 NOT NULL
+);
+
+CREATE FUNCTION public.count_rows() RETURNS trigger
+    LANGUAGE plpgsql
+    AS $$
+BEGIN
+    UPDATE public.counter
+    SET value = value + CASE WHEN TG_OP = 'INSERT' THEN 1 ELSE -1 END
+    WHERE name = TG_ARGV[0];
+    RETURN NULL;
+END;
+$$;
+
+CREATE FUNCTION public.sum_trivia() RETURNS trigger
+    LANGUAGE plpgsql
+    AS $$
+DECLARE
+    new_row public.trivia;
+    old_row public.trivia;
+BEGIN
+    IF TG_OP <> 'DELETE' THEN
+        new_row := NEW;
+    END IF;
+    IF TG_OP <> 'INSERT' THEN
+        old_row := OLD;
+    END IF;
+    UPDATE public.counter
+    SET value = value + CASE name
+        WHEN 'trivia_started' THEN COALESCE(new_row.started, 0) - COALESCE(old_row.started, 0)
+        WHEN 'trivia_won' THEN COALESCE(new_row.won, 0) - COALESCE(old_row.won, 0)
+        WHEN 'trivia_lost' THEN COALESCE(new_row.lost, 0) - COALESCE(old_row.lost, 0)
+        WHEN 'trivia_contribs' THEN COALESCE(new_row.contribs, 0) - COALESCE(old_row.contribs, 0)
+    END
+    WHERE name IN ('trivia_started', 'trivia_won', 'trivia_lost', 'trivia_contribs');
+    RETURN NULL;
+END;
+$$;
+
+-- block writes until the triggers exist, so that the initial counts are exact
+LOCK TABLE public.profile, public.server, public.rating, public.nickname, public.trivia
+    IN SHARE ROW EXCLUSIVE MODE;
+
+CREATE TRIGGER profile_count AFTER INSERT OR DELETE ON public.profile
+    FOR EACH ROW EXECUTE PROCEDURE public.count_rows('profile');
+
+CREATE TRIGGER server_count AFTER INSERT OR DELETE ON public.server
+    FOR EACH ROW EXECUTE PROCEDURE public.count_rows('server');
+
+-- cloned to every partition, so rows deleted by cascade are counted as well
+CREATE TRIGGER rating_count AFTER INSERT OR DELETE ON public.rating
+    FOR EACH ROW EXECUTE PROCEDURE public.count_rows('rating');
+
+CREATE TRIGGER nickname_count AFTER INSERT OR DELETE ON public.nickname
+    FOR EACH ROW EXECUTE PROCEDURE public.count_rows('nickname');
+
+CREATE TRIGGER trivia_sum AFTER INSERT OR UPDATE OR DELETE ON public.trivia
+    FOR EACH ROW EXECUTE PROCEDURE public.sum_trivia();
+
+INSERT INTO public.counter (name, value)
+SELECT 'profile', COUNT(*) FROM public.profile
+UNION ALL
+SELECT 'server', COUNT(*) FROM public.server
+UNION ALL
+SELECT 'rating', COUNT(*) FROM public.rating
+UNION ALL
+SELECT 'nickname', COUNT(*) FROM public.nickname
+UNION ALL
+SELECT 'trivia_started', COALESCE(SUM(started), 0) FROM public.trivia
+UNION ALL
+SELECT 'trivia_won', COALESCE(SUM(won), 0) FROM public.trivia
+UNION ALL
+SELECT 'trivia_lost', COALESCE(SUM(lost), 0) FROM public.trivia
+UNION ALL
+SELECT 'trivia_contribs', COALESCE(SUM(contribs), 0) FROM public.trivia;
@@ -0,0 +1,9 @@
+-- no-transaction
+-- Track when members last ran a command, so that the retention job can find
+-- the inactive ones. Existing members start from the day it's applied.
+
+ALTER TABLE public.member
+    ADD COLUMN IF NOT EXISTS last_seen date DEFAULT CURRENT_DATE NOT NULL;
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS member_last_seen_idx
+    ON public.member (last_seen);
@@ -0,0 +1,5 @@
+-- Bitset of the questions each member has been asked, bit n is set once the
+-- question with id n has been asked. It's cleared when every question has
+-- been asked.
+
+ALTER TABLE public.trivia ADD COLUMN seen bytea;
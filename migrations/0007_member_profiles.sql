@@ -0,0 +1,29 @@
+-- Number of profiles linked by every member. Linking a profile increments it
+-- only while it's under the limit, and the check runs on the latest version
+-- of the member's row, so concurrent links can't go over the limit.
+
+ALTER TABLE public.member ADD COLUMN profiles integer DEFAULT 0 NOT NULL;
+
+CREATE FUNCTION public.uncount_member_profile() RETURNS trigger
+    LANGUAGE plpgsql
+    AS $$
+BEGIN
+    UPDATE public.member SET profiles = profiles - 1 WHERE id = OLD.member_id;
+    RETURN NULL;
+END;
+$$;
+
+-- block links until the trigger exists, so that the initial counts are exact
+LOCK TABLE public.profile, public.member IN SHARE ROW EXCLUSIVE MODE;
+
+CREATE TRIGGER member_profile_uncount AFTER DELETE ON public.profile
+    FOR EACH ROW EXECUTE PROCEDURE public.uncount_member_profile();
+
+UPDATE public.member
+SET profiles = linked.amount
+FROM (
+    SELECT member_id, COUNT(*) AS amount
+    FROM public.profile
+    GROUP BY member_id
+) AS linked
+WHERE member.id = linked.member_id;
@@ -0,0 +1,56 @@
+"""Give an id to the trivia questions that don't have one.
+
+The members' seen questions are stored by question id, so every question
+needs one. Run it once from the repository root, before starting the bot:
+
+    python3 scripts/assign_question_ids.py [assets/questions.json]
+
+If no question has an id yet, each one gets its 1-based position in the file.
+Otherwise the questions without an id get the ids following the largest one,
+so that the existing ids never change. The file is replaced atomically.
+"""
+import os
+import sys
+import json
+
+QUESTIONS_PATH = "assets/questions.json"
+
+
+def assign_ids(questions):
+    """Returns the number of questions an id was given to."""
+    ids = [q["id"] for q in questions if "id" in q]
+    if len(set(ids)) != len(ids):
+        raise ValueError("question ids must be unique")
+    next_id = max(ids, default=0) + 1
+    assigned = 0
+    for position, question in enumerate(questions, 1):
+        if "id" in question:
+            continue
+        if not ids:
+            question["id"] = position
+        else:
+            question["id"] = next_id
+            next_id += 1
+        assigned += 1
+    return assigned
+
+
+def main(path=QUESTIONS_PATH):
+    with open(path) as fp:
+        questions = json.load(fp)
+
+    assigned = assign_ids(questions)
+    if not assigned:
+        print(f"Every question of {path} already has an id.")
+        return
+
+    tmp = f"{path}.tmp"
+    with open(tmp, "w") as fp:
+        json.dump(questions, fp, indent=4, ensure_ascii=False)
+        fp.write("\n")
+    os.replace(tmp, path)
+    print(f"{assigned} of the {len(questions)} questions of {path} were given an id.")
+
+
+if __name__ == "__main__":
+    main(*sys.argv[1:2])
@@ -0,0 +1,177 @@
+import os
+import time
+import zlib
+import asyncio
+import datetime
+
+from utils import queries
+from utils.rating import get_partitions
+
+# Header of every backup, it restores the rows without checking the foreign
+# keys or firing the triggers, since the tables are copied in name order.
+HEADER = b"""-- OverBot data backup. It only contains the rows, to restore it:
+--   1. create an empty database and load schema.sql into it
+--   2. start the bot on it and stop it once it has applied the migrations
+--   3. gunzip -c <backup> | psql -v ON_ERROR_STOP=1 --single-transaction <db>
+-- The restore stops if the database isn't at the backup's migration version,
+-- and replaces the rows the migrations have inserted.
+SET session_replication_role = replica;
+
+"""
+
+# Stops the restore if the migrations applied differ from the backup's ones.
+CHECK_MIGRATIONS = """DO $$
+BEGIN
+    IF (SELECT COALESCE(array_agg(version ORDER BY version), '{{}}')
+            FROM public.schema_migration) <> '{versions}'::integer[] THEN
+        RAISE EXCEPTION 'the database must have exactly the migrations {versions}';
+    END IF;
+END;
+$$;
+
+"""
+
+FOOTER = b"""
+SET session_replication_role = DEFAULT;
+"""
+
+
+class BackupResult:
+
+    __slots__ = ("path", "tables", "rows", "size", "compressed_size", "duration")
+
+    def __init__(self, path, tables, rows, size, compressed_size, duration):
+        self.path = path
+        self.tables = tables
+        self.rows = rows
+        self.size = size
+        self.compressed_size = compressed_size
+        self.duration = duration
+
+    @property
+    def throughput(self):
+        """Uncompressed bytes written per second."""
+        return self.size / max(self.duration, 1e-6)
+
+
+class BackupWriter:
+    """Gzip compresses the chunks it is fed straight into a file.
+
+    The rows are compressed and written in a worker thread, so that a large
+    backup doesn't block the event loop.
+    """
+
+    __slots__ = ("fp", "compressor", "size", "rows", "loop")
+
+    def __init__(self, fp, *, loop=None):
+        self.fp = fp
+        # wbits=31 writes a gzip container, so the file works with gunzip
+        self.compressor = zlib.compressobj(wbits=31)
+        self.size = 0
+        self.rows = 0
+        self.loop = loop or asyncio.get_event_loop()
+
+    def write(self, data):
+        self.size += len(data)
+        self.fp.write(self.compressor.compress(data))
+
+    async def write_rows(self, data):
+        # COPY's text format has a row per line
+        self.rows += data.count(b"\n")
+        # chunks are awaited one at a time, so they're written in order
+        await self.loop.run_in_executor(None, self.write, data)
+
+    def close(self):
+        self.fp.write(self.compressor.flush())
+
+
+def rotate(directory, keep):
+    """Delete the oldest backups, so that only `keep` of them are left."""
+    backups = sorted(
+        name
+        for name in os.listdir(directory)
+        if name.startswith("overbot-") and name.endswith(".sql.gz")
+    )
+    for name in backups[:-keep]:
+        os.remove(os.path.join(directory, name))
+
+
+async def dump(conn, writer):
+    """Stream the rows of every table and the sequence values to the writer.
+
+    The backup empties the tables before copying their rows, and creates the
+    rating partitions the rows go into. Returns the number of tables dumped.
+    """
+    versions = await conn.fetchval(queries.GET_BACKUP_MIGRATIONS)
+    versions = "{" + ",".join(str(v) for v in versions) + "}"
+    writer.write(CHECK_MIGRATIONS.format(versions=versions).encode())
+
+    tables = await conn.fetch(queries.GET_BACKUP_TABLES)
+    names = ", ".join(f"public.{table['name']}" for table in tables)
+    writer.write(f"TRUNCATE {names};\n\n".encode())
+
+    for month in sorted(await get_partitions(conn)):
+        writer.write(f"SELECT public.create_rating_partition('{month}');\n".encode())
+    writer.write(b"\n")
+
+    for table in tables:
+        name = table["name"]
+        columns = ", ".join(table["columns"])
+        writer.write(f"COPY public.{name} ({columns}) FROM stdin;\n".encode())
+        if table["partitioned"]:
+            # partitioned tables can't be copied directly
+            await conn.copy_from_query(
+                f"SELECT {columns} FROM public.{name}", output=writer.write_rows
+            )
+        else:
+            await conn.copy_from_table(
+                name, schema_name="public", output=writer.write_rows
+            )
+        writer.write(b"\\.\n\n")
+
+    for sequence in await conn.fetch(queries.GET_BACKUP_SEQUENCES):
+        writer.write(
+            f"SELECT pg_catalog.setval('public.{sequence['name']}', "
+            f"{sequence['last_value']}, true);\n".encode()
+        )
+    return len(tables)
+
+
+async def create_backup(pool, *, directory, keep):
+    """Dump the rows of every table into a new gzip compressed file.
+
+    The tables are streamed one at a time with COPY inside a single read
+    only transaction, so the backup is consistent and memory usage doesn't
+    depend on the size of the tables. The schema isn't included, see HEADER
+    for how to restore it.
+    """
+    os.makedirs(directory, exist_ok=True)
+    timestamp = datetime.datetime.utcnow().strftime("%Y%m%d-%H%M%S")
+    path = os.path.join(directory, f"overbot-{timestamp}.sql.gz")
+    partial = path + ".part"
+
+    start = time.perf_counter()
+    try:
+        with open(partial, "wb") as fp:
+            writer = BackupWriter(fp)
+            writer.write(HEADER)
+            async with pool.acquire() as conn:
+                async with conn.transaction(isolation="repeatable_read", readonly=True):
+                    tables = await dump(conn, writer)
+            writer.write(FOOTER)
+            await writer.loop.run_in_executor(None, writer.close)
+            compressed_size = fp.tell()
+    except BaseException:
+        os.remove(partial)
+        raise
+    os.replace(partial, path)
+    rotate(directory, keep)
+
+    return BackupResult(
+        path,
+        tables,
+        writer.rows,
+        writer.size,
+        compressed_size,
+        time.perf_counter() - start,
+    )
@@ -0,0 +1,91 @@
+import json
+import uuid
+import asyncio
+
+import asyncpg
+
+from utils import queries
+
+# Channels a process can publish changes to.
+CHANNELS = ("prefix", "locale", "profile", "nickname")
+
+# Prefix of the Postgres channels, so that they don't clash with other apps.
+CHANNEL_PREFIX = "overbot_"
+
+CONNECTION_ERRORS = (
+    OSError,
+    asyncio.TimeoutError,
+    asyncpg.InterfaceError,
+    asyncpg.PostgresConnectionError,
+    asyncpg.CannotConnectNowError,
+)
+
+
+class Bus:
+    """Cache invalidation bus between bot processes built on LISTEN/NOTIFY.
+
+    Changes are published through the pool and received on a dedicated
+    connection, each process ignores the messages it has sent. Handlers are
+    called with the changed key and the new value, if any. Notifications sent
+    while the connection is down are lost, so after a reconnection handlers
+    are called with a ``None`` key, meaning that everything may be stale.
+    """
+
+    def __init__(self, pool, **connect_options):
+        self.pool = pool
+        self.connect_options = connect_options
+        self.id = uuid.uuid4().hex
+        self.conn = None
+        self.handlers = {channel: [] for channel in CHANNELS}
+        self.published = 0
+        self.received = 0
+
+    @property
+    def connected(self):
+        return self.conn is not None and not self.conn.is_closed()
+
+    def subscribe(self, channel, handler):
+        self.handlers[channel].append(handler)
+
+    def unsubscribe(self, channel, handler):
+        self.handlers[channel].remove(handler)
+
+    async def connect(self):
+        """Open the listening connection, returns whether it succeeded."""
+        reconnecting = self.conn is not None
+        try:
+            conn = await asyncpg.connect(**self.connect_options)
+            for channel in CHANNELS:
+                await conn.add_listener(CHANNEL_PREFIX + channel, self.on_notification)
+        except CONNECTION_ERRORS:
+            return False
+
+        self.conn = conn
+        if reconnecting:
+            for channel in CHANNELS:
+                self.dispatch(channel, None, None)
+        return True
+
+    async def ensure_connected(self):
+        if not self.connected:
+            await self.connect()
+
+    def dispatch(self, channel, key, value):
+        for handler in self.handlers[channel]:
+            handler(key, value)
+
+    def on_notification(self, conn, pid, channel, payload):
+        message = json.loads(payload)
+        if message["origin"] == self.id:
+            return
+        self.received += 1
+        self.dispatch(channel[len(CHANNEL_PREFIX) :], message["key"], message["value"])
+
+    async def publish(self, channel, key, value=None):
+        payload = json.dumps({"origin": self.id, "key": key, "value": value})
+        await self.pool.execute(queries.NOTIFY, CHANNEL_PREFIX + channel, payload)
+        self.published += 1
+
+    async def close(self):
+        if self.connected:
+            await self.conn.close()
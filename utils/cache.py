@@ -0,0 +1,63 @@
+import time
+from collections import OrderedDict
+
+_MISSING = object()
+
+
+class LRUCache:
+    """Bounded mapping that evicts the least recently used keys first.
+
+    If ``ttl`` is given, entries expire ``ttl`` seconds after being set.
+    """
+
+    __slots__ = ("maxsize", "ttl", "_data")
+
+    def __init__(self, maxsize=128, *, ttl=None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+
+    def __len__(self):
+        return len(self._data)
+
+    def __contains__(self, key):
+        return self.get(key, _MISSING) is not _MISSING
+
+    def __getitem__(self, key):
+        value = self.get(key, _MISSING)
+        if value is _MISSING:
+            raise KeyError(key)
+        return value
+
+    def __setitem__(self, key, value):
+        expires_at = time.monotonic() + self.ttl if self.ttl is not None else None
+        self._data[key] = (value, expires_at)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def __delitem__(self, key):
+        del self._data[key]
+
+    def get(self, key, default=None):
+        try:
+            value, expires_at = self._data[key]
+        except KeyError:
+            return default
+        if expires_at is not None and expires_at <= time.monotonic():
+            del self._data[key]
+            return default
+        self._data.move_to_end(key)
+        return value
+
+    def pop(self, key, default=None):
+        try:
+            value, expires_at = self._data.pop(key)
+        except KeyError:
+            return default
+        if expires_at is not None and expires_at <= time.monotonic():
+            return default
+        return value
+
+    def clear(self):
+        self._data.clear()
@@ -0,0 +1,99 @@
+import asyncio
+import secrets
+
+from termcolor import colored
+
+
+class CatalogNotLoaded(Exception):
+    """Exception raised when a list hasn't been downloaded yet."""
+
+    pass
+
+
+class Catalog:
+    """The Overwatch heroes and maps, indexed by hero role and map type.
+
+    Both lists are downloaded in the background by `refresh`, so picking a
+    random hero or map never waits for the network.
+    """
+
+    __slots__ = (
+        "urls",
+        "heroes",
+        "heroes_by_role",
+        "hero_keys",
+        "maps",
+        "maps_by_type",
+    )
+
+    def __init__(self, urls):
+        self.urls = urls
+        self.heroes = ()
+        self.heroes_by_role = {}
+        self.hero_keys = frozenset()
+        self.maps = ()
+        self.maps_by_type = {}
+
+    @property
+    def loaded(self):
+        return bool(self.heroes and self.maps)
+
+    @staticmethod
+    def index(items, key):
+        indexed = {}
+        for item in items:
+            indexed.setdefault(item[key], []).append(item)
+        return {k: tuple(v) for k, v in indexed.items()}
+
+    async def fetch(self, session, url):
+        async with session.get(url) as r:
+            return await r.json()
+
+    def load_heroes(self, heroes):
+        self.heroes_by_role = self.index(heroes, "role")
+        self.hero_keys = frozenset(str(h["key"]).lower() for h in heroes)
+        self.heroes = tuple(heroes)
+
+    def load_maps(self, maps):
+        self.maps_by_type = self.index(maps, "type")
+        self.maps = tuple(maps)
+
+    async def refresh(self, session):
+        """Download both lists again, keeping the old one if a download fails.
+
+        Returns whether both lists were refreshed.
+        """
+        heroes, maps = await asyncio.gather(
+            self.fetch(session, self.urls["hero"]),
+            self.fetch(session, self.urls["map"]),
+            return_exceptions=True,
+        )
+        refreshed = True
+        for name, result, load in (
+            ("heroes", heroes, self.load_heroes),
+            ("maps", maps, self.load_maps),
+        ):
+            try:
+                if isinstance(result, Exception):
+                    raise result
+                load(result)
+            except Exception as e:
+                refreshed = False
+                print(f"[{colored('ERROR', 'red')}] {name} refresh failed: {e}")
+        return refreshed
+
+    def random_hero(self, role=None):
+        """Raises IndexError if there is no hero with the given role."""
+        if not self.heroes:
+            raise CatalogNotLoaded("The heroes haven't been downloaded yet.")
+        if role is None:
+            return secrets.choice(self.heroes)
+        return secrets.choice(self.heroes_by_role.get(role, ()))
+
+    def random_map(self, type=None):
+        """Raises IndexError if there is no map of the given type."""
+        if not self.maps:
+            raise CatalogNotLoaded("The maps haven't been downloaded yet.")
+        if type is None:
+            return secrets.choice(self.maps)
+        return secrets.choice(self.maps_by_type.get(type, ()))
@@ -1,5 +1,7 @@
 from discord.ext import commands
 
+from utils.profiles import MAX_PROFILES, get_member_profiles
+
 
 class ProfileNotLinked(commands.CheckFailure):
     """Exception raised when a user have not linked a profile."""
@@ -14,13 +16,8 @@ class ProfileLimitReached(commands.CheckFailure):
 
 
 async def get_profiles(ctx):
-    query = """SELECT platform, username
-            FROM profile
-            INNER JOIN member
-                    ON member.id = profile.member_id
-            WHERE member.id = $1;
-            """
-    return await ctx.bot.pool.fetch(query, ctx.author.id)
+    member_profiles = await get_member_profiles(ctx.bot, ctx.author.id)
+    return member_profiles.profiles
 
 
 def has_profile():
@@ -39,7 +36,7 @@ def can_add_profile():
 
     async def predicate(ctx):
         profiles = await get_profiles(ctx)
-        if len(profiles) < 5:
+        if len(profiles) < MAX_PROFILES:
             return True
         raise ProfileLimitReached()
 
@@ -0,0 +1,54 @@
+import json
+
+
+class PlanNode:
+
+    __slots__ = ("name", "exclusive_time", "rows", "planned_rows", "hit", "read")
+
+    def __init__(self, node):
+        name = node["Node Type"]
+        relation = node.get("Index Name") or node.get("Relation Name")
+        self.name = f"{name} on {relation}" if relation else name
+
+        loops = node.get("Actual Loops", 1)
+        total = node.get("Actual Total Time", 0.0) * loops
+        children = sum(
+            child.get("Actual Total Time", 0.0) * child.get("Actual Loops", 1)
+            for child in node.get("Plans", ())
+        )
+        # time spent in the node itself, without its children
+        self.exclusive_time = max(total - children, 0.0)
+        self.rows = node.get("Actual Rows", 0) * loops
+        self.planned_rows = node.get("Plan Rows", 0) * loops
+        self.hit = node.get("Shared Hit Blocks", 0)
+        self.read = node.get("Shared Read Blocks", 0)
+
+
+def walk(node):
+    yield PlanNode(node)
+    for child in node.get("Plans", ()):
+        yield from walk(child)
+
+
+def summarize_plan(plan, amount=5):
+    """Returns the lines describing the nodes that took the most time.
+
+    ``plan`` is the output of ``EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON)``.
+    """
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    plan = plan[0]
+
+    nodes = sorted(walk(plan["Plan"]), key=lambda n: n.exclusive_time, reverse=True)
+    lines = [
+        f"Planning: {plan.get('Planning Time', 0.0):.2f}ms | "
+        f"Execution: {plan.get('Execution Time', 0.0):.2f}ms",
+        "",
+    ]
+    for node in nodes[:amount]:
+        lines.append(
+            f"{node.exclusive_time:>9.2f}ms {node.name}\n"
+            f"            rows {node.rows} (planned {node.planned_rows}) | "
+            f"buffers hit {node.hit} read {node.read}"
+        )
+    return lines
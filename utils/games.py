@@ -0,0 +1,115 @@
+import random
+
+from utils import queries
+
+
+class TriviaRound:
+    """A trivia question answered by everyone in a channel.
+
+    Only the first valid reaction of every member counts as their answer.
+    """
+
+    __slots__ = ("question", "answers", "reactions", "choices")
+
+    def __init__(self, question):
+        self.question = question
+        self.answers = random.sample(question.answers, len(question.answers))
+        self.reactions = [f"{i}\u20e3" for i in range(1, len(self.answers) + 1)]
+        self.choices = {}
+
+    def answer(self, member_id, emoji):
+        if member_id in self.choices or emoji not in self.reactions:
+            return False
+        self.choices[member_id] = self.answers[self.reactions.index(emoji)]
+        return True
+
+    def results(self):
+        """Returns whether every member who answered was right."""
+        correct_answer = self.question.correct_answer
+        return {
+            member_id: answer == correct_answer
+            for member_id, answer in self.choices.items()
+        }
+
+
+class TriviaGames:
+    """Collects the outcome of the trivia games until they are flushed.
+
+    Games are summed per member, so a flush writes a row per member that
+    played since the last one, whatever the number of games.
+    """
+
+    __slots__ = ("pending",)
+
+    def __init__(self):
+        self.pending = {}
+
+    def __len__(self):
+        return len(self.pending)
+
+    def get(self, member_id):
+        """Returns the [started, won, lost, seen] not yet written, if any."""
+        return self.pending.get(member_id)
+
+    def discard(self, member_id):
+        self.pending.pop(member_id, None)
+
+    def record(self, member_id, *, won=None, seen=None):
+        """Record a game, ``won`` is None if the member didn't answer."""
+        try:
+            entry = self.pending[member_id]
+        except KeyError:
+            entry = self.pending[member_id] = [0, 0, 0, None]
+        entry[0] += 1
+        if won is not None:
+            entry[1 if won else 2] += 1
+        if seen is not None:
+            entry[3] = seen
+
+    def merge(self, pending):
+        for member_id, (started, won, lost, seen) in pending.items():
+            try:
+                entry = self.pending[member_id]
+            except KeyError:
+                self.pending[member_id] = [started, won, lost, seen]
+            else:
+                entry[0] += started
+                entry[1] += won
+                entry[2] += lost
+                # the seen questions recorded later are more recent
+                if entry[3] is None:
+                    entry[3] = seen
+
+    def apply(self, member_id, stats):
+        """Returns the member's stats with the games not yet written added."""
+        entry = self.pending.get(member_id)
+        if entry is None:
+            return stats
+        stats = dict(stats or {"won": 0, "lost": 0, "started": 0, "contribs": 0})
+        stats["started"] += entry[0]
+        stats["won"] += entry[1]
+        stats["lost"] += entry[2]
+        return stats
+
+    async def flush(self, pool):
+        """Write the pending games with a single statement.
+
+        If the write fails, the games are kept for the next flush.
+        Returns the updated rows.
+        """
+        pending, self.pending = self.pending, {}
+        if not pending:
+            return []
+
+        columns = [[] for _ in range(5)]
+        for member_id, values in pending.items():
+            for column, value in zip(columns, (member_id, *values)):
+                column.append(value)
+
+        try:
+            return await pool.fetch(
+                queries.UPSERT_TRIVIA_GAMES, *columns, background=True
+            )
+        except BaseException:
+            self.merge(pending)
+            raise
@@ -0,0 +1,52 @@
+class Leaderboard:
+    """The top entries of a table ranked by one of its columns.
+
+    The board is loaded once from the database and then kept up to date by
+    feeding it the rows returned by the statements that change the score, so
+    reading it never needs a query. Entries whose score doesn't make it past
+    the current cutoff are discarded.
+    """
+
+    __slots__ = ("size", "key", "exclude", "entries", "stale")
+
+    def __init__(self, size, *, key, exclude=()):
+        self.size = size
+        self.key = key
+        self.exclude = frozenset(exclude)
+        self.entries = {}
+        # whether entries left the board and it must be reloaded to be refilled
+        self.stale = True
+
+    def __len__(self):
+        return len(self.entries)
+
+    @property
+    def cutoff(self):
+        """The lowest score on the board, 0 while it isn't full."""
+        if len(self.entries) < self.size:
+            return 0
+        return min(entry[self.key] for entry in self.entries.values())
+
+    def load(self, rows):
+        self.entries = {row["id"]: dict(row) for row in rows[: self.size]}
+        self.stale = False
+
+    def update(self, row):
+        id = row["id"]
+        if id in self.exclude:
+            return
+
+        if id in self.entries or len(self.entries) < self.size:
+            self.entries[id] = dict(row)
+        elif row[self.key] > self.cutoff:
+            last = min(self.entries.values(), key=lambda e: e[self.key])
+            del self.entries[last["id"]]
+            self.entries[id] = dict(row)
+
+    def remove(self, id):
+        if self.entries.pop(id, None) is not None:
+            self.stale = True
+
+    def top(self, amount=None):
+        entries = sorted(self.entries.values(), key=lambda e: e[self.key], reverse=True)
+        return entries[:amount]
@@ -0,0 +1,114 @@
+import os
+import re
+
+from termcolor import colored
+
+MIGRATIONS_DIR = "migrations"
+
+# Migrations starting with this line are run statement by statement outside of
+# a transaction, which is required by e.g. CREATE INDEX CONCURRENTLY.
+NO_TRANSACTION = "-- no-transaction"
+
+# Arbitrary key used to make sure only one process applies migrations at a time.
+LOCK_KEY = 4_741_726
+
+_FILENAME_REGEX = re.compile(r"^(?P<version>\d+)_(?P<name>\w+)\.sql$")
+
+
+class Migration:
+
+    __slots__ = ("version", "name", "sql")
+
+    def __init__(self, version, name, sql):
+        self.version = version
+        self.name = name
+        self.sql = sql
+
+    def __str__(self):
+        return f"{self.version:04d}_{self.name}"
+
+    @property
+    def transactional(self):
+        return not self.sql.startswith(NO_TRANSACTION)
+
+    @property
+    def statements(self):
+        for statement in self.sql.split(";"):
+            lines = [
+                line for line in statement.splitlines() if not line.startswith("--")
+            ]
+            statement = "\n".join(lines).strip()
+            if statement:
+                yield statement
+
+
+def get_migrations(directory=MIGRATIONS_DIR):
+    migrations = []
+    for filename in os.listdir(directory):
+        match = _FILENAME_REGEX.match(filename)
+        if not match:
+            continue
+        with open(os.path.join(directory, filename)) as fp:
+            sql = fp.read()
+        migrations.append(Migration(int(match["version"]), match["name"], sql))
+    migrations.sort(key=lambda m: m.version)
+    return migrations
+
+
+async def drop_invalid_indexes(conn):
+    """Drop indexes left invalid by an interrupted concurrent build."""
+    query = """SELECT indexrelid::regclass::text
+            FROM pg_index
+            INNER JOIN pg_class
+                    ON pg_class.oid = pg_index.indexrelid
+            WHERE NOT indisvalid
+            AND pg_class.relnamespace = 'public'::regnamespace;
+            """
+    for index in await conn.fetch(query):
+        await conn.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {index[0]};")
+
+
+async def apply(conn, migration):
+    query = "INSERT INTO schema_migration(version, name) VALUES($1, $2);"
+    if migration.transactional:
+        async with conn.transaction():
+            await conn.execute(migration.sql)
+            await conn.execute(query, migration.version, migration.name)
+    else:
+        await drop_invalid_indexes(conn)
+        for statement in migration.statements:
+            await conn.execute(statement)
+        await conn.execute(query, migration.version, migration.name)
+
+
+async def apply_migrations(pool, directory=MIGRATIONS_DIR):
+    """Apply the migrations which haven't been applied yet, in order."""
+    async with pool.acquire() as conn:
+        await conn.execute("SELECT pg_advisory_lock($1);", LOCK_KEY)
+        try:
+            await conn.execute(
+                """CREATE TABLE IF NOT EXISTS public.schema_migration (
+                    version integer PRIMARY KEY,
+                    name text NOT NULL,
+                    applied_at timestamp with time zone DEFAULT now() NOT NULL
+                );"""
+            )
+            rows = await conn.fetch("SELECT version FROM schema_migration;")
+            applied = {row["version"] for row in rows}
+
+            for migration in get_migrations(directory):
+                if migration.version in applied:
+                    continue
+                try:
+                    await apply(conn, migration)
+                except Exception as e:
+                    print(
+                        f"[{colored('ERROR', 'red')}] {str(migration):20} failed to apply!\n[{e}]"
+                    )
+                    raise
+                else:
+                    print(
+                        f"[{colored('OK', 'green')}] {str(migration):20} successfully applied"
+                    )
+        finally:
+            await conn.execute("SELECT pg_advisory_unlock($1);", LOCK_KEY)
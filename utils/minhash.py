@@ -0,0 +1,90 @@
+import re
+import zlib
+import random
+
+# Number of hash functions, that is the length of a signature.
+PERMUTATIONS = 64
+
+# Signatures are split in bands of rows, two texts are candidate duplicates
+# when all the rows of at least one of their bands are equal.
+BANDS = 16
+ROWS = 4
+
+# Number of words of a shingle.
+SHINGLE_SIZE = 2
+
+_PRIME = (1 << 61) - 1
+
+# seeded, so that signatures don't change between restarts
+_random = random.Random(64)
+_PERMUTATIONS = tuple(
+    (_random.randrange(1, _PRIME), _random.randrange(0, _PRIME))
+    for _ in range(PERMUTATIONS)
+)
+
+
+def shingles(text):
+    words = re.findall(r"\w+", text.lower())
+    if len(words) <= SHINGLE_SIZE:
+        return {" ".join(words)}
+    return {
+        " ".join(words[i : i + SHINGLE_SIZE])
+        for i in range(len(words) - SHINGLE_SIZE + 1)
+    }
+
+
+def signature(text):
+    hashes = [zlib.crc32(s.encode()) for s in shingles(text)]
+    return tuple(
+        [min([(a * h + b) % _PRIME for h in hashes]) for a, b in _PERMUTATIONS]
+    )
+
+
+def similarity(a, b):
+    """Estimates the Jaccard similarity of the texts of two signatures."""
+    return sum(x == y for x, y in zip(a, b)) / PERMUTATIONS
+
+
+class MinHashIndex:
+    """Finds the texts similar to a given one without comparing it to all of them.
+
+    Texts are indexed by the bands of their MinHash signature, so a lookup
+    only compares the texts sharing at least a band with the given one.
+    """
+
+    __slots__ = ("signatures", "buckets")
+
+    def __init__(self):
+        self.signatures = {}
+        self.buckets = tuple({} for _ in range(BANDS))
+
+    def __len__(self):
+        return len(self.signatures)
+
+    @staticmethod
+    def bands(sig):
+        for i in range(BANDS):
+            yield sig[i * ROWS : (i + 1) * ROWS]
+
+    def add(self, key, text=None, *, sig=None):
+        """Index a text, pass ``sig`` if its signature is already known."""
+        if sig is None:
+            sig = signature(text)
+        self.signatures[key] = sig
+        for buckets, band in zip(self.buckets, self.bands(sig)):
+            buckets.setdefault(band, set()).add(key)
+
+    def query(self, text, threshold=0.5):
+        """Returns the (similarity, key) of the similar texts, most similar first."""
+        sig = signature(text)
+        candidates = set()
+        for buckets, band in zip(self.buckets, self.bands(sig)):
+            candidates.update(buckets.get(band, ()))
+
+        results = []
+        for key in candidates:
+            score = similarity(sig, self.signatures[key])
+            if score >= threshold:
+                results.append((score, key))
+        results.sort(key=lambda r: r[0], reverse=True)
+        return results
@@ -3,6 +3,7 @@ from datetime import date
 
 import discord
 
+from utils import queries
 from utils.i18n import _
 
 SR = "<:sr:639897739920146437>"
@@ -113,16 +114,10 @@ class Player:
         damage = kwargs.get("damage", 0)
         support = kwargs.get("support", 0)
 
-        query = """SELECT tank, damage, support
-                   FROM rating
-                   INNER JOIN profile
-                           ON profile.id = rating.profile_id
-                   WHERE profile.id = $1
-                   AND rating.date = $2;
-                """
-
         requested_at = date.today()
-        roles = await ctx.bot.pool.fetch(query, profile_id, requested_at)
+        roles = await ctx.bot.pool.fetch(
+            queries.GET_DAILY_RATINGS, profile_id, requested_at
+        )
 
         if roles:
             # Assuming a user uses `-profile rating` multiple times in the same day,
@@ -134,8 +129,9 @@ class Player:
                     all_equals = True
 
         if not roles or not all_equals:
-            query = "INSERT INTO rating(tank, damage, support, profile_id) VALUES($1, $2, $3, $4);"
-            await ctx.bot.pool.execute(query, tank, damage, support, profile_id)
+            await ctx.bot.pool.execute(
+                queries.INSERT_RATING, tank, damage, support, profile_id
+            )
 
     def resolve_ratings(self):
         if not self.data["ratings"]:
@@ -0,0 +1,435 @@
+import time
+import bisect
+import asyncio
+import datetime
+from collections import deque
+
+import asyncpg
+
+from utils import queries
+
+# Upper bounds (in seconds) of the histogram buckets.
+BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Errors meaning the replica can't be reached, so the statement is run on the
+# primary instead. Other client errors are bugs and are raised as is.
+REPLICA_ERRORS = (
+    OSError,
+    asyncpg.ConnectionDoesNotExistError,
+    asyncpg.PostgresConnectionError,
+    asyncpg.CannotConnectNowError,
+)
+
+# The connection limit grows when the 95th percentile of the acquire wait or
+# the peak share of leased connections of the last window reach these values,
+# and shrinks when both are below the shrink ones.
+GROW_WAIT = 0.01
+GROW_USAGE = 0.8
+SHRINK_WAIT = 0.001
+SHRINK_USAGE = 0.5
+
+
+class PoolSaturated(Exception):
+    """Raised when a background statement is shed because the pool is full."""
+
+    pass
+
+
+def normalize(query):
+    """Returns the key the statement's metrics are stored under.
+
+    Catalog queries are keyed by name, ad-hoc ones by their collapsed text.
+    """
+    try:
+        return query.name
+    except AttributeError:
+        return " ".join(query.split())
+
+
+def redact(args):
+    """Replace query parameters with their type names."""
+    return tuple(f"${i}={type(arg).__name__}" for i, arg in enumerate(args, start=1))
+
+
+class Histogram:
+
+    __slots__ = ("counts", "count", "total", "max")
+
+    def __init__(self):
+        # the last bucket holds the values above BUCKETS[-1]
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, value):
+        self.counts[bisect.bisect_left(BUCKETS, value)] += 1
+        self.count += 1
+        self.total += value
+        if value > self.max:
+            self.max = value
+
+    @property
+    def mean(self):
+        if not self.count:
+            return 0.0
+        return self.total / self.count
+
+    def percentile(self, percent):
+        """Returns the upper bound of the bucket the percentile falls into."""
+        if not self.count:
+            return 0.0
+        rank = self.count * percent / 100
+        seen = 0
+        for bound, count in zip(BUCKETS, self.counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return self.max
+
+
+class QueryStats:
+
+    __slots__ = ("query", "timings", "errors")
+
+    def __init__(self, query):
+        self.query = query
+        self.timings = Histogram()
+        self.errors = 0
+
+
+class SlowQuery:
+
+    __slots__ = ("query", "params", "duration", "timestamp")
+
+    def __init__(self, query, params, duration):
+        self.query = query
+        self.params = params
+        self.duration = duration
+        self.timestamp = datetime.datetime.utcnow()
+
+
+class Connection:
+    """Proxy of an acquired connection that times every statement it runs."""
+
+    __slots__ = ("_pool", "_conn")
+
+    def __init__(self, pool, conn):
+        self._pool = pool
+        self._conn = conn
+
+    def __getattr__(self, attr):
+        return getattr(self._conn, attr)
+
+    async def _run(self, method, query, args, timeout):
+        start = time.perf_counter()
+        try:
+            return await getattr(self._conn, method)(query, *args, timeout=timeout)
+        except Exception:
+            self._pool.record_error(query)
+            raise
+        finally:
+            self._pool.record_query(query, args, time.perf_counter() - start)
+
+    async def fetch(self, query, *args, timeout=None):
+        return await self._run("fetch", query, args, timeout)
+
+    async def fetchrow(self, query, *args, timeout=None):
+        return await self._run("fetchrow", query, args, timeout)
+
+    async def fetchval(self, query, *args, timeout=None):
+        return await self._run("fetchval", query, args, timeout)
+
+    async def execute(self, query, *args, timeout=None):
+        return await self._run("execute", query, args, timeout)
+
+    async def executemany(self, query, args, *, timeout=None):
+        start = time.perf_counter()
+        try:
+            return await self._conn.executemany(query, args, timeout=timeout)
+        except Exception:
+            self._pool.record_error(query)
+            raise
+        finally:
+            self._pool.record_query(query, (), time.perf_counter() - start)
+
+
+class PoolAcquireContext:
+
+    __slots__ = ("pool", "timeout", "background", "conn")
+
+    def __init__(self, pool, timeout, background):
+        self.pool = pool
+        self.timeout = timeout
+        self.background = background
+        self.conn = None
+
+    async def __aenter__(self):
+        self.conn = await self.pool.acquire_connection(
+            timeout=self.timeout, background=self.background
+        )
+        return Connection(self.pool, self.conn)
+
+    async def __aexit__(self, *exc):
+        conn, self.conn = self.conn, None
+        await self.pool.release(conn)
+
+
+class Pool:
+    """Instrumented wrapper around an asyncpg pool.
+
+    It exposes the same query API as :class:`asyncpg.pool.Pool`, while keeping
+    per-statement timings, acquire wait times, pool saturation and a log of
+    the slowest queries (parameters are redacted).
+
+    The number of leased connections is capped by a limit that `resize` moves
+    between the pool's min and max size following the load, idle connections
+    above it are closed by asyncpg. Background statements are shed with
+    :exc:`PoolSaturated` instead of queueing when no connection is free.
+
+    When a replica is configured, the read-only catalog statements run through
+    fetch, fetchrow and fetchval are sent to it as long as its replication lag
+    is within ``max_replica_lag`` seconds, otherwise they run on the primary.
+    """
+
+    def __init__(
+        self,
+        pool,
+        *,
+        slow_query_threshold=0.25,
+        slow_query_log_size=50,
+        replica_options=None,
+        max_replica_lag=30.0,
+    ):
+        self._pool = pool
+        self.slow_query_threshold = slow_query_threshold
+        self.statements = {}
+        self.acquire_wait = Histogram()
+        self.slow_queries = deque(maxlen=slow_query_log_size)
+        self.peak_in_use = 0
+        # asyncpg accepts min_size=0, but a limit of 0 would block every acquire
+        self.limit = max(pool.get_min_size(), 1)
+        self.leased = 0
+        self.waiting = 0
+        self.shed = 0
+        self.resizes = 0
+        self._slots = asyncio.Condition()
+        # acquire wait and peak leased connections since the last resize
+        self.window_wait = Histogram()
+        self.window_peak = 0
+        self.started_at = datetime.datetime.utcnow()
+        self.replica = None
+        self.replica_options = replica_options
+        self.max_replica_lag = max_replica_lag
+        # None while the replica is unreachable or its lag is unknown
+        self.replica_lag = None
+        self.replica_fallbacks = 0
+
+    @classmethod
+    async def create(
+        cls, *, replica=None, max_replica_lag=30.0, slow_query_threshold=0.25, **kwargs
+    ):
+        kwargs.setdefault("statement_cache_size", queries.statement_cache_size())
+        kwargs.setdefault("max_inactive_connection_lifetime", 60.0)
+        pool = await asyncpg.create_pool(**kwargs)
+        replica_options = None
+        if replica:
+            replica_options = dict(
+                dsn=replica,
+                min_size=1,
+                max_size=max(pool.get_max_size() // 2, 1),
+                max_inactive_connection_lifetime=kwargs[
+                    "max_inactive_connection_lifetime"
+                ],
+                command_timeout=kwargs.get("command_timeout"),
+                statement_cache_size=kwargs["statement_cache_size"],
+            )
+        self = cls(
+            pool,
+            slow_query_threshold=slow_query_threshold,
+            replica_options=replica_options,
+            max_replica_lag=max_replica_lag,
+        )
+        await self.check_replica()
+        return self
+
+    @property
+    def size(self):
+        return self._pool.get_size()
+
+    @property
+    def min_size(self):
+        return self._pool.get_min_size()
+
+    @property
+    def max_size(self):
+        return self._pool.get_max_size()
+
+    @property
+    def in_use(self):
+        return self._pool.get_size() - self._pool.get_idle_size()
+
+    @property
+    def saturation(self):
+        return self.leased / self.limit
+
+    @property
+    def saturated(self):
+        return self.leased >= self.limit
+
+    async def resize(self):
+        """Grow or shrink the connection limit based on the load since the last call."""
+        wait = self.window_wait.percentile(95)
+        usage = self.window_peak / self.limit
+        limit = self.limit
+        if wait >= GROW_WAIT or usage >= GROW_USAGE:
+            # grow by a quarter, so that bursts are absorbed in a few windows
+            limit = min(self.limit + max(self.limit // 4, 1), self.max_size)
+        elif wait <= SHRINK_WAIT and usage <= SHRINK_USAGE:
+            limit = max(self.limit - 1, self.min_size, 1)
+
+        async with self._slots:
+            if limit != self.limit:
+                self.resizes += 1
+                self.limit = limit
+                self._slots.notify_all()
+            self.window_wait = Histogram()
+            self.window_peak = self.leased
+
+        if self.replica is not None:
+            await self.replica.resize()
+
+    @property
+    def replica_available(self):
+        return (
+            self.replica is not None
+            and self.replica_lag is not None
+            and self.replica_lag <= self.max_replica_lag
+        )
+
+    async def check_replica(self):
+        """Connect to the replica if needed and measure its replication lag."""
+        if not self.replica_options:
+            return
+        try:
+            if self.replica is None:
+                pool = await asyncpg.create_pool(**self.replica_options)
+                self.replica = Pool(
+                    pool, slow_query_threshold=self.slow_query_threshold
+                )
+            self.replica_lag = await self.replica.fetchval(queries.GET_REPLICATION_LAG)
+        except (asyncio.TimeoutError, *REPLICA_ERRORS):
+            self.replica_lag = None
+
+    def route(self, query):
+        """Returns the pool the statement should be run on."""
+        if getattr(query, "read_only", False) and self.replica_available:
+            return self.replica
+        return self
+
+    def record_query(self, query, args, duration):
+        key = normalize(query)
+        try:
+            stats = self.statements[key]
+        except KeyError:
+            stats = self.statements[key] = QueryStats(key)
+        stats.timings.add(duration)
+        if duration >= self.slow_query_threshold:
+            self.slow_queries.append(SlowQuery(key, redact(args), duration))
+
+    def record_error(self, query):
+        key = normalize(query)
+        try:
+            self.statements[key].errors += 1
+        except KeyError:
+            self.statements[key] = QueryStats(key)
+            self.statements[key].errors += 1
+
+    def get_top_statements(self, amount=5):
+        """Returns the statements that spent the most time in the database."""
+        statements = sorted(
+            self.statements.values(), key=lambda s: s.timings.total, reverse=True
+        )
+        return statements[:amount]
+
+    async def acquire_connection(self, *, timeout=None, background=False):
+        if background and self.saturated:
+            self.shed += 1
+            raise PoolSaturated(f"all {self.limit} connections are in use")
+
+        start = time.perf_counter()
+        async with self._slots:
+            self.waiting += 1
+            try:
+                await asyncio.wait_for(
+                    self._slots.wait_for(lambda: self.leased < self.limit), timeout
+                )
+            finally:
+                self.waiting -= 1
+            self.leased += 1
+        if timeout is not None:
+            # the slot and the connection share a single deadline
+            timeout = max(timeout - (time.perf_counter() - start), 0.0)
+        try:
+            conn = await self._pool.acquire(timeout=timeout)
+        except BaseException:
+            await self._free_slot()
+            raise
+
+        wait = time.perf_counter() - start
+        self.acquire_wait.add(wait)
+        self.window_wait.add(wait)
+        self.window_peak = max(self.window_peak, self.leased)
+        self.peak_in_use = max(self.peak_in_use, self.leased)
+        return conn
+
+    def acquire(self, *, timeout=None, background=False):
+        return PoolAcquireContext(self, timeout, background)
+
+    async def _free_slot(self):
+        async with self._slots:
+            self.leased -= 1
+            # a single waiter could be cancelled right after being woken up
+            self._slots.notify_all()
+
+    async def release(self, conn):
+        try:
+            await self._pool.release(conn)
+        finally:
+            await self._free_slot()
+
+    async def _read(self, method, query, args, timeout, background):
+        pool = self.route(query)
+        if pool is not self:
+            try:
+                return await getattr(pool, method)(
+                    query, *args, timeout=timeout, background=background
+                )
+            except REPLICA_ERRORS:
+                # stop routing to the replica until the next successful check
+                self.replica_lag = None
+                self.replica_fallbacks += 1
+        async with self.acquire(background=background) as conn:
+            return await getattr(conn, method)(query, *args, timeout=timeout)
+
+    async def fetch(self, query, *args, timeout=None, background=False):
+        return await self._read("fetch", query, args, timeout, background)
+
+    async def fetchrow(self, query, *args, timeout=None, background=False):
+        return await self._read("fetchrow", query, args, timeout, background)
+
+    async def fetchval(self, query, *args, timeout=None, background=False):
+        return await self._read("fetchval", query, args, timeout, background)
+
+    async def execute(self, query, *args, timeout=None, background=False):
+        async with self.acquire(background=background) as conn:
+            return await conn.execute(query, *args, timeout=timeout)
+
+    async def executemany(self, query, args, *, timeout=None, background=False):
+        async with self.acquire(background=background) as conn:
+            return await conn.executemany(query, args, timeout=timeout)
+
+    async def close(self):
+        if self.replica is not None:
+            await self.replica.close()
+        await self._pool.close()
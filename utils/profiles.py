@@ -0,0 +1,67 @@
+from utils import queries
+
+# Maximum number of profiles a member can link.
+MAX_PROFILES = 5
+
+
+class LinkedProfile:
+    """An Overwatch profile linked to a Discord account."""
+
+    __slots__ = ("id", "platform", "username", "index", "is_main")
+
+    def __init__(self, *, id, platform, username, index, is_main):
+        self.id = id
+        self.platform = platform
+        self.username = username
+        self.index = index
+        self.is_main = is_main
+
+    @property
+    def display_name(self):
+        if self.platform == "pc":
+            return self.username.replace("-", "#")
+        return self.username
+
+
+class MemberProfiles:
+    """The profiles linked by a member, ordered by index."""
+
+    __slots__ = ("profiles",)
+
+    def __init__(self, profiles):
+        self.profiles = profiles
+
+    def __len__(self):
+        return len(self.profiles)
+
+    def __iter__(self):
+        return iter(self.profiles)
+
+    @property
+    def main(self):
+        for profile in self.profiles:
+            if profile.is_main:
+                return profile
+        return None
+
+    def get(self, index):
+        """Returns the profile at the given 1-based index, raises IndexError."""
+        return self.profiles[abs(index) - 1]
+
+
+async def get_member_profiles(bot, member_id):
+    """Returns the member's profiles, querying the database on cache miss only."""
+    cached = bot.profiles.get(member_id)
+    if cached is not None:
+        return cached
+
+    rows = await bot.pool.fetch(queries.GET_MEMBER_PROFILES, member_id)
+    profiles = MemberProfiles([LinkedProfile(**dict(row)) for row in rows])
+    bot.profiles[member_id] = profiles
+    return profiles
+
+
+async def invalidate(bot, member_id):
+    """Evict a member's profiles from the caches of every process."""
+    bot.profiles.pop(member_id)
+    await bot.bus.publish("profile", member_id)
@@ -0,0 +1,549 @@
+"""Every SQL statement run by the bot, declared once.
+
+The migration runner in utils/migrations.py is the exception, its own
+bookkeeping statements are kept next to it, since it runs before anything
+else and doesn't go through the pool's metrics.
+
+Statements are plain strings, so they can be passed to any asyncpg method.
+Read-only statements that tolerate slightly stale data are flagged with
+``read_only``, so that the pool can run them on a replica.
+asyncpg prepares a statement the first time a connection runs it and keeps it
+in the connection's LRU statement cache, which is sized to fit the whole
+catalog plus some headroom (see `statement_cache_size`). Catalog statements
+are usually parsed and planned once per connection, but they can still be
+evicted by many ad-hoc statements, and they are dropped along with the
+connections the pool closes after being idle. Their name is used as the key
+of the pool's usage metrics.
+"""
+
+CATALOG = {}
+
+
+class Query(str):
+    """A named SQL statement."""
+
+    def __new__(cls, name, sql, *, read_only=False):
+        if name in CATALOG:
+            raise ValueError(f"query {name!r} is already declared")
+        self = super().__new__(cls, sql)
+        self.name = name
+        self.read_only = read_only
+        CATALOG[name] = self
+        return self
+
+
+def statement_cache_size(headroom=100):
+    """Statement cache size that fits the catalog plus ad-hoc statements."""
+    return len(CATALOG) + headroom
+
+
+# command
+
+GET_TOTAL_COMMANDS = Query(
+    "get_total_commands", "SELECT total FROM command;", read_only=True
+)
+
+INCREMENT_TOTAL_COMMANDS = Query(
+    "increment_total_commands", "UPDATE command SET total = total + 1 WHERE id = 1;"
+)
+
+# command usage
+
+INSERT_COMMAND_USAGE = Query(
+    "insert_command_usage",
+    """INSERT INTO command_usage AS usage(
+        bucket, command, guild_id, locale, outcome, uses, latency_sum, latency_max
+    )
+    SELECT * FROM unnest(
+        $1::timestamp[], $2::text[], $3::bigint[], $4::text[], $5::text[],
+        $6::int[], $7::float8[], $8::float8[]
+    )
+    ON CONFLICT (bucket, command, guild_id, locale, outcome) DO
+    UPDATE SET uses = usage.uses + EXCLUDED.uses,
+        latency_sum = usage.latency_sum + EXCLUDED.latency_sum,
+        latency_max = GREATEST(usage.latency_max, EXCLUDED.latency_max);
+    """,
+)
+
+ROLLUP_COMMAND_USAGE_HOURLY = Query(
+    "rollup_command_usage_hourly",
+    """INSERT INTO command_usage_hourly AS usage(
+        bucket, command, guild_id, locale, outcome, uses, latency_sum, latency_max
+    )
+    SELECT date_trunc('hour', bucket), command, guild_id, locale, outcome,
+        SUM(uses), SUM(latency_sum), MAX(latency_max)
+    FROM command_usage
+    WHERE bucket >= $1 AND bucket < $2
+    GROUP BY 1, 2, 3, 4, 5
+    ON CONFLICT (bucket, command, guild_id, locale, outcome) DO
+    UPDATE SET uses = EXCLUDED.uses,
+        latency_sum = EXCLUDED.latency_sum,
+        latency_max = EXCLUDED.latency_max;
+    """,
+)
+
+ROLLUP_COMMAND_USAGE_DAILY = Query(
+    "rollup_command_usage_daily",
+    """INSERT INTO command_usage_daily AS usage(
+        bucket, command, guild_id, locale, outcome, uses, latency_sum, latency_max
+    )
+    SELECT date_trunc('day', bucket), command, guild_id, locale, outcome,
+        SUM(uses), SUM(latency_sum), MAX(latency_max)
+    FROM command_usage_hourly
+    WHERE bucket >= $1 AND bucket < $2
+    GROUP BY 1, 2, 3, 4, 5
+    ON CONFLICT (bucket, command, guild_id, locale, outcome) DO
+    UPDATE SET uses = EXCLUDED.uses,
+        latency_sum = EXCLUDED.latency_sum,
+        latency_max = EXCLUDED.latency_max;
+    """,
+)
+
+# Where the hourly and daily rollups have to restart from.
+GET_COMMAND_USAGE_ROLLUPS = Query(
+    "get_command_usage_rollups",
+    """SELECT (SELECT MAX(bucket) FROM command_usage_hourly) AS last_hour,
+        (SELECT MIN(bucket) FROM command_usage) AS first_minute,
+        (SELECT MAX(bucket) FROM command_usage_daily) AS last_day,
+        (SELECT MIN(bucket) FROM command_usage_hourly) AS first_hour;
+    """,
+)
+
+DELETE_COMMAND_USAGE = Query(
+    "delete_command_usage", "DELETE FROM command_usage WHERE bucket < $1;"
+)
+
+DELETE_COMMAND_USAGE_HOURLY = Query(
+    "delete_command_usage_hourly", "DELETE FROM command_usage_hourly WHERE bucket < $1;"
+)
+
+# The daily buckets from $1 to $2 and the hourly ones of the day from $2.
+GET_COMMAND_USAGE = Query(
+    "get_command_usage",
+    """SELECT command, SUM(uses) AS uses,
+        COALESCE(SUM(uses) FILTER (WHERE outcome = 'failed'), 0) AS failures,
+        SUM(latency_sum) / SUM(uses) AS latency,
+        MAX(latency_max) AS latency_max
+    FROM (
+        SELECT command, outcome, uses, latency_sum, latency_max
+        FROM command_usage_daily
+        WHERE bucket >= $1 AND bucket < $2
+        UNION ALL
+        SELECT command, outcome, uses, latency_sum, latency_max
+        FROM command_usage_hourly
+        WHERE bucket >= $2
+    ) AS usage
+    GROUP BY command
+    ORDER BY uses DESC;
+    """,
+    read_only=True,
+)
+
+GET_RECENT_COMMAND_USAGE = Query(
+    "get_recent_command_usage",
+    """SELECT command, SUM(uses) AS uses,
+        COALESCE(SUM(uses) FILTER (WHERE outcome = 'failed'), 0) AS failures,
+        SUM(latency_sum) / SUM(uses) AS latency,
+        MAX(latency_max) AS latency_max
+    FROM command_usage
+    WHERE bucket >= $1
+    GROUP BY command
+    ORDER BY uses DESC;
+    """,
+    read_only=True,
+)
+
+# server
+
+GET_PREFIXES = Query("get_prefixes", "SELECT id, prefix FROM server;")
+
+GET_PREFIX = Query("get_prefix", "SELECT prefix FROM server WHERE id = $1;")
+
+SET_PREFIX = Query("set_prefix", "UPDATE server SET prefix = $1 WHERE id = $2;")
+
+INSERT_SERVER = Query("insert_server", "INSERT INTO server(id, prefix) VALUES($1, $2);")
+
+DELETE_SERVER = Query("delete_server", "DELETE FROM server WHERE id = $1;")
+
+DIFF_SERVERS = Query(
+    "diff_servers",
+    """WITH current AS (
+        SELECT unnest($1::bigint[]) AS id
+    ), stored AS (
+        SELECT id
+        FROM server
+        WHERE (id >> 22) % $2 = ANY($3::int[])
+    )
+    SELECT ARRAY(SELECT id FROM current EXCEPT SELECT id FROM stored) AS missing,
+        ARRAY(SELECT id FROM stored EXCEPT SELECT id FROM current) AS stale;
+    """,
+)
+
+INSERT_SERVERS = Query(
+    "insert_servers",
+    """INSERT INTO server(id, prefix)
+    SELECT unnest($1::bigint[]), $2
+    ON CONFLICT (id) DO NOTHING;
+    """,
+)
+
+DELETE_SERVERS = Query(
+    "delete_servers", "DELETE FROM server WHERE id = ANY($1::bigint[]);"
+)
+
+INCREMENT_SERVER_COMMANDS = Query(
+    "increment_server_commands",
+    """INSERT INTO server(id, prefix)
+    VALUES($1, $2)
+    ON CONFLICT (id) DO
+    UPDATE SET commands_run = server.commands_run + 1
+    RETURNING id, commands_run;
+    """,
+)
+
+GET_TOP_SERVERS = Query(
+    "get_top_servers",
+    """SELECT id, commands_run
+    FROM server
+    WHERE id <> ALL($1::bigint[])
+    ORDER BY commands_run DESC
+    LIMIT $2;
+    """,
+    read_only=True,
+)
+
+# member
+
+INCREMENT_MEMBER_COMMANDS = Query(
+    "increment_member_commands",
+    """INSERT INTO member(id)
+    VALUES($1)
+    ON CONFLICT (id) DO
+    UPDATE SET commands_run = member.commands_run + 1, last_seen = CURRENT_DATE;
+    """,
+)
+
+GET_INACTIVE_MEMBERS = Query(
+    "get_inactive_members",
+    """SELECT COALESCE(array_agg(id), '{}')
+    FROM (
+        SELECT id
+        FROM member
+        WHERE last_seen < $1
+        LIMIT $2
+    ) AS inactive;
+    """,
+)
+
+# Deletes the members that are still inactive along with their trivia stats,
+# their profiles, ratings and nicknames are deleted by the FK cascades and
+# counted beforehand.
+DELETE_INACTIVE_MEMBERS = Query(
+    "delete_inactive_members",
+    """WITH doomed AS (
+        SELECT id
+        FROM member
+        WHERE id = ANY($1::bigint[])
+        AND last_seen < $2
+        FOR UPDATE
+    ), profiles AS (
+        SELECT id
+        FROM profile
+        WHERE member_id IN (SELECT id FROM doomed)
+    ), cascaded AS (
+        SELECT (SELECT COUNT(*) FROM profiles) AS profiles,
+            (SELECT COUNT(*) FROM rating WHERE profile_id IN (SELECT id FROM profiles))
+                AS ratings,
+            (SELECT COUNT(*) FROM nickname WHERE profile_id IN (SELECT id FROM profiles))
+                AS nicknames
+    ), deleted_members AS (
+        DELETE FROM member
+        WHERE id IN (SELECT id FROM doomed)
+        RETURNING id
+    ), deleted_trivia AS (
+        DELETE FROM trivia
+        WHERE id IN (SELECT id FROM deleted_members)
+        RETURNING id
+    )
+    SELECT ARRAY(SELECT id FROM deleted_members) AS members,
+        (SELECT COUNT(*) FROM deleted_trivia) AS trivia,
+        cascaded.*
+    FROM cascaded;
+    """,
+)
+
+GET_LOCALE = Query("get_locale", "SELECT locale FROM member WHERE id = $1;")
+
+GET_LOCALES = Query(
+    "get_locales", "SELECT id, locale FROM member WHERE id = ANY($1::bigint[]);"
+)
+
+SET_LOCALE = Query(
+    "set_locale",
+    """INSERT INTO member(id, locale)
+    VALUES($1, $2)
+    ON CONFLICT (id) DO
+    UPDATE SET locale = $2;
+    """,
+)
+
+SET_MAIN_PROFILE = Query(
+    "set_main_profile", "UPDATE member SET main_profile = $1 WHERE id = $2;"
+)
+
+# profile
+
+GET_MEMBER_PROFILES = Query(
+    "get_member_profiles",
+    """SELECT profile.id, platform, username,
+        row_number() OVER (ORDER BY profile.id) AS index,
+        profile.id IS NOT DISTINCT FROM member.main_profile AS is_main
+    FROM profile
+    INNER JOIN member
+            ON member.id = profile.member_id
+    WHERE member.id = $1
+    ORDER BY profile.id;
+    """,
+)
+
+# Links a profile if the member has less than $4 profiles, making it the main
+# one if there's none yet. Returns no row when the limit has been reached.
+# The limit is checked by the upsert of member.profiles, which runs on the
+# latest version of the row, so concurrent links can't go over it.
+LINK_PROFILE = Query(
+    "link_profile",
+    """WITH new_profile AS (
+        SELECT nextval(pg_get_serial_sequence('profile', 'id'))::int AS id
+    ), upserted_member AS (
+        INSERT INTO member(id, main_profile, profiles)
+        SELECT $3, id, 1 FROM new_profile
+        ON CONFLICT (id) DO
+        UPDATE SET profiles = member.profiles + 1,
+            main_profile = COALESCE(member.main_profile, EXCLUDED.main_profile)
+        WHERE member.profiles < $4
+        RETURNING main_profile, profiles
+    ), inserted_profile AS (
+        INSERT INTO profile(id, platform, username, member_id)
+        SELECT new_profile.id, $1, $2, $3 FROM new_profile, upserted_member
+        RETURNING id
+    )
+    SELECT inserted_profile.id, upserted_member.profiles AS index,
+        upserted_member.main_profile = inserted_profile.id AS is_main
+    FROM inserted_profile, upserted_member;
+    """,
+)
+
+UPDATE_PROFILE = Query(
+    "update_profile",
+    "UPDATE profile SET platform = $1, username = $2 WHERE id = $3;",
+)
+
+DELETE_PROFILE = Query("delete_profile", "DELETE FROM profile WHERE id = $1;")
+
+# rating
+
+GET_DAILY_RATINGS = Query(
+    "get_daily_ratings",
+    """SELECT tank, damage, support
+    FROM rating
+    WHERE profile_id = $1
+    AND date = $2;
+    """,
+)
+
+INSERT_RATING = Query(
+    "insert_rating",
+    "INSERT INTO rating(tank, damage, support, profile_id) VALUES($1, $2, $3, $4);",
+)
+
+GET_RATING_PARTITIONS = Query(
+    "get_rating_partitions",
+    """SELECT child.relname
+    FROM pg_inherits
+    INNER JOIN pg_class AS child
+            ON child.oid = pg_inherits.inhrelid
+    WHERE pg_inherits.inhparent = 'public.rating'::regclass;
+    """,
+)
+
+CREATE_RATING_PARTITION = Query(
+    "create_rating_partition", "SELECT create_rating_partition($1);"
+)
+
+GET_ROLLED_UP_MONTHS = Query("get_rolled_up_months", "SELECT month FROM rating_rollup;")
+
+ROLLUP_RATINGS = Query(
+    "rollup_ratings",
+    """INSERT INTO rating_weekly AS weekly(
+        profile_id, week,
+        tank_min, tank_max, tank_last,
+        damage_min, damage_max, damage_last,
+        support_min, support_max, support_last
+    )
+    SELECT profile_id, date_trunc('week', date)::date AS week,
+        min(tank), max(tank), (array_agg(tank ORDER BY date DESC, id DESC))[1],
+        min(damage), max(damage), (array_agg(damage ORDER BY date DESC, id DESC))[1],
+        min(support), max(support), (array_agg(support ORDER BY date DESC, id DESC))[1]
+    FROM rating
+    WHERE date >= $1 AND date < $2
+    AND profile_id IS NOT NULL
+    GROUP BY profile_id, week
+    ON CONFLICT (profile_id, week) DO
+    UPDATE SET tank_min = LEAST(weekly.tank_min, EXCLUDED.tank_min),
+        tank_max = GREATEST(weekly.tank_max, EXCLUDED.tank_max),
+        tank_last = COALESCE(EXCLUDED.tank_last, weekly.tank_last),
+        damage_min = LEAST(weekly.damage_min, EXCLUDED.damage_min),
+        damage_max = GREATEST(weekly.damage_max, EXCLUDED.damage_max),
+        damage_last = COALESCE(EXCLUDED.damage_last, weekly.damage_last),
+        support_min = LEAST(weekly.support_min, EXCLUDED.support_min),
+        support_max = GREATEST(weekly.support_max, EXCLUDED.support_max),
+        support_last = COALESCE(EXCLUDED.support_last, weekly.support_last);
+    """,
+)
+
+INSERT_RATING_ROLLUP = Query(
+    "insert_rating_rollup", "INSERT INTO rating_rollup(month) VALUES($1);"
+)
+
+# nickname
+
+HAS_NICKNAME = Query("has_nickname", "SELECT id FROM nickname WHERE id = $1;")
+
+INSERT_NICKNAME = Query(
+    "insert_nickname",
+    "INSERT INTO nickname(id, server_id, profile_id) VALUES($1, $2, $3);",
+)
+
+DELETE_NICKNAME = Query("delete_nickname", "DELETE FROM nickname WHERE id = $1;")
+
+# trivia
+
+GET_TRIVIA_STATS = Query("get_trivia_stats", "SELECT * FROM trivia WHERE id = $1;")
+
+GET_BEST_TRIVIA_PLAYERS = Query(
+    "get_best_trivia_players",
+    """SELECT id, started, won, lost
+    FROM trivia
+    WHERE id <> ALL($1::bigint[])
+    ORDER BY won DESC
+    LIMIT $2;
+    """,
+    read_only=True,
+)
+
+GET_TRIVIA_SEEN = Query("get_trivia_seen", "SELECT seen FROM trivia WHERE id = $1;")
+
+UPSERT_TRIVIA_GAMES = Query(
+    "upsert_trivia_games",
+    """INSERT INTO trivia(id, started, won, lost, seen)
+    SELECT * FROM unnest(
+        $1::bigint[], $2::int[], $3::int[], $4::int[], $5::bytea[]
+    )
+    ON CONFLICT (id) DO
+    UPDATE SET started = trivia.started + EXCLUDED.started,
+        won = trivia.won + EXCLUDED.won,
+        lost = trivia.lost + EXCLUDED.lost,
+        seen = COALESCE(EXCLUDED.seen, trivia.seen)
+    RETURNING id, started, won, lost;
+    """,
+)
+
+INCREMENT_TRIVIA_CONTRIBS = Query(
+    "increment_trivia_contribs",
+    """INSERT INTO trivia(id, contribs)
+    VALUES($1, 1)
+    ON CONFLICT (id) DO
+    UPDATE SET contribs = trivia.contribs + 1;
+    """,
+)
+
+# news
+
+GET_NEWS_ID = Query("get_news_id", "SELECT news_id FROM news WHERE id = 1;")
+
+SET_NEWS_ID = Query("set_news_id", "UPDATE news SET news_id = $1 WHERE id = 1;")
+
+# admin
+
+GET_COUNTERS = Query("get_counters", "SELECT name, value FROM counter;", read_only=True)
+
+GET_ESTIMATED_ROWS = Query(
+    "get_estimated_rows",
+    """SELECT parent.relname AS name,
+        SUM(GREATEST(child.reltuples, 0))::bigint AS value
+    FROM pg_class AS parent
+    LEFT JOIN pg_inherits
+           ON pg_inherits.inhparent = parent.oid
+    INNER JOIN pg_class AS child
+            ON child.oid = COALESCE(pg_inherits.inhrelid, parent.oid)
+    WHERE parent.relname = ANY($1::text[])
+    AND parent.relnamespace = 'public'::regnamespace
+    GROUP BY parent.relname;
+    """,
+    read_only=True,
+)
+
+ADD_TO_COUNTER = Query(
+    "add_to_counter", "UPDATE counter SET value = value + $2 WHERE name = $1;"
+)
+
+GET_TRIVIA_TOTALS = Query(
+    "get_trivia_totals",
+    "SELECT SUM(started), SUM(won), SUM(lost), SUM(contribs) FROM trivia;",
+    read_only=True,
+)
+
+# bus
+
+NOTIFY = Query("notify", "SELECT pg_notify($1, $2);")
+
+# backup
+
+GET_BACKUP_TABLES = Query(
+    "get_backup_tables",
+    """SELECT relname AS name, relkind = 'p' AS partitioned,
+        ARRAY(
+            SELECT quote_ident(attname)
+            FROM pg_attribute
+            WHERE attrelid = pg_class.oid
+            AND attnum > 0
+            AND NOT attisdropped
+            ORDER BY attnum
+        ) AS columns
+    FROM pg_class
+    WHERE relnamespace = 'public'::regnamespace
+    AND relkind IN ('r', 'p')
+    AND NOT relispartition
+    AND relname <> 'schema_migration'
+    -- detached rating partitions, they only exist in this database
+    AND relname !~ '^rating_[0-9]{4}_[0-9]{2}$'
+    ORDER BY relname;
+    """,
+)
+
+GET_BACKUP_MIGRATIONS = Query(
+    "get_backup_migrations",
+    "SELECT COALESCE(array_agg(version ORDER BY version), '{}') FROM schema_migration;",
+)
+
+GET_BACKUP_SEQUENCES = Query(
+    "get_backup_sequences",
+    """SELECT sequencename AS name, last_value
+    FROM pg_sequences
+    WHERE schemaname = 'public'
+    AND last_value IS NOT NULL
+    ORDER BY sequencename;
+    """,
+)
+
+# replica
+
+GET_REPLICATION_LAG = Query(
+    "get_replication_lag",
+    """SELECT CASE
+        WHEN NOT pg_is_in_recovery() THEN 0
+        WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+        ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp())::float
+    END;
+    """,
+)
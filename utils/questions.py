@@ -0,0 +1,235 @@
+import os
+import json
+import asyncio
+import secrets
+
+from termcolor import colored
+
+from utils.minhash import MinHashIndex
+
+QUESTIONS_PATH = "assets/questions.json"
+
+# Category of the questions that don't have one.
+DEFAULT_CATEGORY = "general"
+
+# Number of seconds between two checks of the file's mtime.
+CHECK_INTERVAL = 5.0
+
+# Random draws tried before looking for the unseen questions one by one.
+MAX_DRAWS = 8
+
+
+class QuestionsUnavailable(Exception):
+    """Exception raised when the questions couldn't be loaded."""
+
+    pass
+
+
+class Question:
+
+    __slots__ = (
+        "id",
+        "category",
+        "question",
+        "image_url",
+        "correct_answer",
+        "wrong_answers",
+    )
+
+    def __init__(self, data):
+        self.id = data["id"]
+        self.category = data.get("category", DEFAULT_CATEGORY)
+        self.question = data["question"]
+        self.image_url = data.get("image_url")
+        self.correct_answer = data["correct_answer"]
+        self.wrong_answers = tuple(data["wrong_answers"])
+
+    @property
+    def answers(self):
+        return (self.correct_answer, *self.wrong_answers)
+
+
+class SeenQuestions:
+    """Bitset of the ids of the questions a member has been asked."""
+
+    __slots__ = ("bits",)
+
+    def __init__(self, data=None):
+        self.bits = bytearray(data or b"")
+
+    def __contains__(self, id):
+        index = id >> 3
+        return index < len(self.bits) and bool(self.bits[index] & (1 << (id & 7)))
+
+    def add(self, id):
+        index = id >> 3
+        if index >= len(self.bits):
+            self.bits.extend(bytes(index - len(self.bits) + 1))
+        self.bits[index] |= 1 << (id & 7)
+
+    def clear(self):
+        self.bits = bytearray()
+
+    def to_bytes(self):
+        return bytes(self.bits)
+
+
+class QuestionBank:
+    """The trivia questions, indexed by id, category and text similarity.
+
+    The questions are loaded once by `load` at startup, then `refresh` reads
+    the file again in an executor whenever its mtime changes. The new
+    questions replace the old ones all at once, so a pick never sees a
+    partial bank and never touches the file.
+
+    Every question needs an ``id``, which the members' seen questions are
+    stored by. Ids must never change or be reused, and should stay small
+    since a seen bitset takes a bit per id up to the largest one.
+    """
+
+    __slots__ = ("path", "mtime", "questions", "by_id", "by_category", "index")
+
+    def __init__(self, path=QUESTIONS_PATH):
+        self.path = path
+        self.mtime = None
+        self.questions = ()
+        self.by_id = {}
+        self.by_category = {}
+        self.index = MinHashIndex()
+
+    def __len__(self):
+        return len(self.questions)
+
+    def stat(self):
+        """Returns the mtime of the file, None if it can't be accessed."""
+        try:
+            return os.stat(self.path).st_mtime_ns
+        except OSError:
+            return None
+
+    def signatures(self):
+        """Returns the signatures of the loaded questions by question text."""
+        return {
+            q.question: self.index.signatures[q.id]
+            for q in self.questions
+            if q.id in self.index.signatures
+        }
+
+    def read(self, signatures):
+        """Read the file and build its questions without touching the bank.
+
+        Only the signatures of the questions not in ``signatures`` are
+        computed. Returns the state to pass to `swap`.
+        """
+        mtime = os.stat(self.path).st_mtime_ns
+        with open(self.path) as fp:
+            data = json.load(fp)
+
+        if not all("id" in q for q in data):
+            raise ValueError(
+                "some questions have no id, run scripts/assign_question_ids.py"
+            )
+        questions = tuple(Question(q) for q in data)
+        ids = [question.id for question in questions]
+        if not all(type(i) is int and i > 0 for i in ids) or len(set(ids)) != len(ids):
+            raise ValueError("question ids must be unique positive integers")
+        by_category = {}
+        for question in questions:
+            by_category.setdefault(question.category, []).append(question)
+
+        index = MinHashIndex()
+        for question in questions:
+            index.add(
+                question.id, question.question, sig=signatures.get(question.question)
+            )
+
+        by_id = {question.id: question for question in questions}
+        by_category = {k: tuple(v) for k, v in by_category.items()}
+        return mtime, questions, by_id, by_category, index
+
+    def swap(self, state):
+        """Replace the questions and their index with the ones of `read`.
+
+        The new index only has the questions of the file, so the submissions
+        added since the last load are dropped and no longer flagged.
+        """
+        self.mtime, self.questions, self.by_id, self.by_category, self.index = state
+
+    def load(self):
+        """Load the questions in the current thread, meant for startup only.
+
+        On failure the bank stays empty until `refresh` sees the file change.
+        Like every reload, it replaces the index and drops the submissions.
+        """
+        try:
+            self.swap(self.read(self.signatures()))
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            self.mtime = self.stat()
+            print(f"[{colored('ERROR', 'red')}] {self.path} loading failed: {e}")
+
+    async def refresh(self, *, loop=None):
+        """Reload the questions in an executor if the file has changed.
+
+        The submissions indexed by `add_submission` are dropped, see `swap`.
+        """
+        loop = loop or asyncio.get_event_loop()
+        mtime = await loop.run_in_executor(None, self.stat)
+        if mtime is None or mtime == self.mtime:
+            return
+        try:
+            state = await loop.run_in_executor(None, self.read, self.signatures())
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            # keep serving the questions loaded before until the file changes
+            self.mtime = mtime
+            print(f"[{colored('ERROR', 'red')}] {self.path} reload failed: {e}")
+        else:
+            self.swap(state)
+
+    def get(self, id):
+        return self.by_id.get(id)
+
+    def add_submission(self, id, text):
+        """Index a submitted question, so that it's flagged if submitted again.
+
+        Submissions are only indexed until the questions are loaded again.
+        """
+        self.index.add(("submission", id), text)
+
+    def similar(self, text, threshold=0.5):
+        """Returns the (similarity, question) of the questions similar to text.
+
+        The submissions added by `add_submission` are returned by their key.
+        """
+        if not self.questions:
+            raise QuestionsUnavailable("The questions couldn't be loaded.")
+        return [
+            (score, self.by_id.get(key, key))
+            for score, key in self.index.query(text, threshold)
+        ]
+
+    def random(self, category=None, *, seen=None):
+        """Pick a random question.
+
+        If ``seen`` is given, the question is picked among the ones not in it
+        and added to it, which is cleared once every question has been seen.
+        As long as most questions are unseen a pick takes a few draws, the
+        unseen ones are only collected when the draws keep hitting seen ones.
+        """
+        if not self.questions:
+            raise QuestionsUnavailable("The questions couldn't be loaded.")
+        questions = self.questions if category is None else self.by_category[category]
+        if seen is None:
+            return secrets.choice(questions)
+
+        for _ in range(MAX_DRAWS):
+            question = secrets.choice(questions)
+            if question.id not in seen:
+                break
+        else:
+            unseen = [q for q in questions if q.id not in seen]
+            if not unseen:
+                seen.clear()
+                unseen = questions
+            question = secrets.choice(unseen)
+        seen.add(question.id)
+        return question
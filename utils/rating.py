@@ -0,0 +1,78 @@
+import re
+import datetime
+
+from utils import queries
+
+_PARTITION_REGEX = re.compile(r"^rating_(?P<year>\d{4})_(?P<month>\d{2})$")
+
+# Number of monthly partitions created ahead of the current one.
+PARTITIONS_AHEAD = 2
+
+
+def add_months(month, amount):
+    """Returns the first day of the month ``amount`` months after ``month``."""
+    index = month.year * 12 + month.month - 1 + amount
+    return datetime.date(index // 12, index % 12 + 1, 1)
+
+
+def get_partition_month(name):
+    match = _PARTITION_REGEX.match(name)
+    if not match:
+        return None
+    return datetime.date(int(match["year"]), int(match["month"]), 1)
+
+
+async def get_partitions(conn):
+    """Returns a mapping of partition month to partition name."""
+    partitions = {}
+    for row in await conn.fetch(queries.GET_RATING_PARTITIONS):
+        month = get_partition_month(row["relname"])
+        if month:
+            partitions[month] = row["relname"]
+    return partitions
+
+
+async def maintain_ratings(pool, *, rollup_after, detach_after):
+    """Keep the rating partitions in shape.
+
+    Creates the partitions of the upcoming months, rolls up the partitions
+    older than ``rollup_after`` months into weekly summaries and detaches the
+    rolled up partitions older than ``detach_after`` months.
+    Returns the months created, rolled up and detached.
+    """
+    current = datetime.date.today().replace(day=1)
+    created, rolled_up, detached = [], [], []
+
+    async with pool.acquire(background=True) as conn:
+        partitions = await get_partitions(conn)
+        for amount in range(PARTITIONS_AHEAD + 1):
+            month = add_months(current, amount)
+            if month not in partitions:
+                await conn.execute(queries.CREATE_RATING_PARTITION, month)
+                created.append(month)
+
+        rows = await conn.fetch(queries.GET_ROLLED_UP_MONTHS)
+        rolled_up_months = {row["month"] for row in rows}
+
+        for month, name in sorted(partitions.items()):
+            if month >= add_months(current, -rollup_after):
+                break
+            if month not in rolled_up_months:
+                async with conn.transaction():
+                    await conn.execute(
+                        queries.ROLLUP_RATINGS, month, add_months(month, 1)
+                    )
+                    await conn.execute(queries.INSERT_RATING_ROLLUP, month)
+                rolled_up_months.add(month)
+                rolled_up.append(month)
+
+            if month < add_months(current, -detach_after):
+                async with conn.transaction():
+                    # the detached table is kept, so that it can be archived
+                    await conn.execute(f'ALTER TABLE rating DETACH PARTITION "{name}";')
+                    # its rows no longer belong to rating
+                    count = await conn.fetchval(f'SELECT COUNT(*) FROM "{name}";')
+                    await conn.execute(queries.ADD_TO_COUNTER, "rating", -count)
+                detached.append(month)
+
+    return created, rolled_up, detached
@@ -0,0 +1,55 @@
+import time
+import asyncio
+import datetime
+from collections import Counter
+
+from utils import queries
+
+# Maximum number of inactive members looked up by a single run.
+MAX_MEMBERS_PER_RUN = 50_000
+
+MIN_BATCH_SIZE = 10
+
+MAX_BATCH_SIZE = 5000
+
+
+async def purge_inactive_members(
+    pool, *, inactive_days, batch_size, latency_budget, on_delete=None
+):
+    """Delete the members who haven't run a command for `inactive_days`.
+
+    The inactive ids are looked up with a single query, then deleted in
+    batches whose size is halved when a batch takes longer than
+    `latency_budget` and doubled when it takes less than half of it. Between
+    batches the job sleeps as long as the batch took, so that it never holds
+    more than half of a connection's time. `on_delete` is awaited with the ids
+    of every deleted batch. Returns the number of rows deleted per table.
+    """
+    cutoff = datetime.date.today() - datetime.timedelta(days=inactive_days)
+    member_ids = await pool.fetchval(
+        queries.GET_INACTIVE_MEMBERS, cutoff, MAX_MEMBERS_PER_RUN, background=True
+    )
+
+    reclaimed = Counter()
+    while member_ids:
+        batch, member_ids = member_ids[:batch_size], member_ids[batch_size:]
+
+        start = time.perf_counter()
+        row = await pool.fetchrow(
+            queries.DELETE_INACTIVE_MEMBERS, batch, cutoff, background=True
+        )
+        elapsed = time.perf_counter() - start
+
+        reclaimed["members"] += len(row["members"])
+        for table in ("trivia", "profiles", "ratings", "nicknames"):
+            reclaimed[table] += row[table]
+        if on_delete:
+            await on_delete(row["members"])
+
+        if elapsed > latency_budget:
+            batch_size = max(batch_size // 2, MIN_BATCH_SIZE)
+        elif elapsed < latency_budget / 2:
+            batch_size = min(batch_size * 2, MAX_BATCH_SIZE)
+        await asyncio.sleep(elapsed)
+
+    return reclaimed
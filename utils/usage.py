@@ -0,0 +1,118 @@
+import datetime
+
+from utils import queries
+
+# Minute buckets are kept for this long after being rolled up.
+MINUTE_RETENTION = datetime.timedelta(days=2)
+
+# Hourly buckets are kept for this long after being rolled up.
+HOURLY_RETENTION = datetime.timedelta(days=90)
+
+
+class UsageAggregator:
+    """Aggregates command invocations per minute until they are flushed.
+
+    Invocations are keyed by (bucket, command, guild_id, locale, outcome),
+    so the number of rows written doesn't grow with the number of commands
+    run, only with how varied they are.
+    """
+
+    __slots__ = ("pending",)
+
+    def __init__(self):
+        self.pending = {}
+
+    def __len__(self):
+        return len(self.pending)
+
+    def record(self, command, *, guild_id, locale, outcome, latency):
+        bucket = datetime.datetime.utcnow().replace(second=0, microsecond=0)
+        key = (bucket, command, guild_id or 0, locale, outcome)
+        try:
+            entry = self.pending[key]
+        except KeyError:
+            self.pending[key] = [1, latency, latency]
+        else:
+            entry[0] += 1
+            entry[1] += latency
+            entry[2] = max(entry[2], latency)
+
+    def merge(self, pending):
+        for key, (uses, latency_sum, latency_max) in pending.items():
+            try:
+                entry = self.pending[key]
+            except KeyError:
+                self.pending[key] = [uses, latency_sum, latency_max]
+            else:
+                entry[0] += uses
+                entry[1] += latency_sum
+                entry[2] = max(entry[2], latency_max)
+
+    async def flush(self, pool):
+        """Write the pending buckets with a single statement.
+
+        If the write fails, the buckets are kept for the next flush.
+        Returns the number of rows written.
+        """
+        pending, self.pending = self.pending, {}
+        if not pending:
+            return 0
+
+        columns = [[] for _ in range(8)]
+        for key, values in pending.items():
+            for column, value in zip(columns, (*key, *values)):
+                column.append(value)
+
+        try:
+            await pool.execute(queries.INSERT_COMMAND_USAGE, *columns, background=True)
+        except BaseException:
+            self.merge(pending)
+            raise
+        return len(pending)
+
+
+def rollup_start(last, first, default):
+    """Returns where a rollup starts from.
+
+    It restarts from its last bucket, or from the first bucket it rolls up if
+    it never ran, so that no bucket is skipped when runs are missed. The
+    ``default`` window is always recomputed, so that buckets flushed late are
+    included.
+    """
+    if last is not None:
+        return min(last, default)
+    if first is not None:
+        return min(first, default)
+    return default
+
+
+async def rollup_usage(pool):
+    """Roll up the complete hours and days not rolled up yet and prune old buckets."""
+    now = datetime.datetime.utcnow()
+    hour = now.replace(minute=0, second=0, microsecond=0)
+    day = hour.replace(hour=0)
+    async with pool.acquire(background=True) as conn:
+        async with conn.transaction():
+            rollups = await conn.fetchrow(queries.GET_COMMAND_USAGE_ROLLUPS)
+            await conn.execute(
+                queries.ROLLUP_COMMAND_USAGE_HOURLY,
+                rollup_start(
+                    rollups["last_hour"],
+                    rollups["first_minute"],
+                    hour - datetime.timedelta(hours=2),
+                ),
+                hour,
+            )
+            await conn.execute(
+                queries.ROLLUP_COMMAND_USAGE_DAILY,
+                rollup_start(
+                    rollups["last_day"],
+                    rollups["first_hour"],
+                    day - datetime.timedelta(days=2),
+                ),
+                day,
+            )
+            await conn.execute(queries.DELETE_COMMAND_USAGE, hour - MINUTE_RETENTION)
+            await conn.execute(
+                queries.DELETE_COMMAND_USAGE_HOURLY, day - HOURLY_RETENTION
+            )